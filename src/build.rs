@@ -1,21 +1,36 @@
-use crate::utils::byte_offset_to_position;
+use crate::utils::LineIndex;
 use std::path::Path;
 use tower_lsp::lsp_types::{Diagnostic, DiagnosticSeverity, NumberOrString, Position, Range};
 
+/// Error codes ignored in test and script files (contract code size limits)
+const TEST_IGNORED_ERROR_CODES: &[&str] = &["5574", "3860"];
+
 fn ignored_code_for_tests(value: &serde_json::Value) -> bool {
     let error_code = value
         .get("errorCode")
         .and_then(|v| v.as_str())
         .unwrap_or_default();
+    if !TEST_IGNORED_ERROR_CODES.contains(&error_code) {
+        return false;
+    }
+
     let file_path = value
         .get("sourceLocation")
         .and_then(|loc| loc.get("file"))
         .and_then(|f| f.as_str())
         .unwrap_or_default();
+    file_path.contains(".t.sol") || file_path.contains(".s.sol")
+}
 
-    // Ignore error code 5574, 3860 for test files (code size limit)
-    (error_code == "5574" && (file_path.contains(".t.sol") || file_path.contains(".s.sol")))
-        || (error_code == "3860" && (file_path.contains(".t.sol") || file_path.contains(".s.sol")))
+/// LSP severity of a forge diagnostic `level`, shared by build and lint output.
+/// Unknown levels are reported as information
+pub fn diagnostic_severity(level: &str) -> DiagnosticSeverity {
+    match level {
+        "error" => DiagnosticSeverity::ERROR,
+        "warning" => DiagnosticSeverity::WARNING,
+        "help" => DiagnosticSeverity::HINT,
+        _ => DiagnosticSeverity::INFORMATION,
+    }
 }
 
 pub fn build_output_to_diagnostics(
@@ -24,6 +39,7 @@ pub fn build_output_to_diagnostics(
     content: &str,
 ) -> Vec<Diagnostic> {
     let mut diagnostics = Vec::new();
+    let lines = LineIndex::new(content);
 
     if let Some(errors) = forge_output.get("errors").and_then(|e| e.as_array()) {
         for err in errors {
@@ -31,8 +47,10 @@ pub fn build_output_to_diagnostics(
                 continue;
             }
 
-            let source_file = err
-                .get("sourceLocation")
+            // File, start and end all live under the source location, so look it up
+            // once for the three of them
+            let location = err.get("sourceLocation");
+            let source_file = location
                 .and_then(|loc| loc.get("file"))
                 .and_then(|f| f.as_str())
                 .and_then(|full_path| Path::new(full_path).file_name())
@@ -42,29 +60,26 @@ pub fn build_output_to_diagnostics(
                 continue;
             }
 
-            let start_offset = err
-                .get("sourceLocation")
+            let start_offset = location
                 .and_then(|loc| loc.get("start"))
                 .and_then(|s| s.as_u64())
                 .unwrap_or(0) as usize;
 
-            let end_offset = err
-                .get("sourceLocation")
+            let end_offset = location
                 .and_then(|loc| loc.get("end"))
                 .and_then(|s| s.as_u64())
                 .map(|v| v as usize)
                 .unwrap_or(start_offset);
 
-            let (start_line, start_col) = byte_offset_to_position(content, start_offset);
-            let (mut end_line, mut end_col) = byte_offset_to_position(content, end_offset);
+            let ((start_line, start_col), (mut end_line, mut end_col)) =
+                lines.range(start_offset, end_offset);
 
             if end_col > 0 {
                 end_col -= 1;
             } else if end_line > 0 {
                 end_line -= 1;
-                end_col = content
-                    .lines()
-                    .nth(end_line.try_into().unwrap())
+                end_col = lines
+                    .line(content, end_line)
                     .map(|l| l.len() as u32)
                     .unwrap_or(0);
             }
@@ -86,13 +101,11 @@ pub fn build_output_to_diagnostics(
                 .unwrap_or("Unknown error")
                 .to_string();
 
-            let severity = match err.get("severity").and_then(|s| s.as_str()) {
-                Some("error") => Some(DiagnosticSeverity::ERROR),
-                Some("warning") => Some(DiagnosticSeverity::WARNING),
-                Some("note") => Some(DiagnosticSeverity::INFORMATION),
-                Some("help") => Some(DiagnosticSeverity::HINT),
-                _ => Some(DiagnosticSeverity::INFORMATION),
-            };
+            let severity = Some(diagnostic_severity(
+                err.get("severity")
+                    .and_then(|s| s.as_str())
+                    .unwrap_or_default(),
+            ));
 
             let code = err
                 .get("errorCode")
@@ -120,6 +133,7 @@ pub fn build_output_to_diagnostics(
 mod tests {
     use super::*;
     use crate::runner::{ForgeRunner, Runner};
+    use crate::utils::byte_offset_to_position;
     use std::fs;
 
     static CONTRACT: &str = r#"// SPDX-License-Identifier: MIT
@@ -275,4 +289,13 @@ libs = ["lib"]
         });
         assert!(!ignored_code_for_tests(&error_json_other_code));
     }
+
+    #[test]
+    fn test_diagnostic_severity() {
+        assert_eq!(diagnostic_severity("error"), DiagnosticSeverity::ERROR);
+        assert_eq!(diagnostic_severity("warning"), DiagnosticSeverity::WARNING);
+        assert_eq!(diagnostic_severity("note"), DiagnosticSeverity::INFORMATION);
+        assert_eq!(diagnostic_severity("help"), DiagnosticSeverity::HINT);
+        assert_eq!(diagnostic_severity(""), DiagnosticSeverity::INFORMATION);
+    }
 }
@@ -0,0 +1,114 @@
+use std::{collections::HashMap, time::Duration};
+use tokio::{sync::Mutex, time::Instant};
+
+/// Trailing-edge debouncer keyed by document URI, with an upper bound on how long a
+/// burst of triggers can postpone the run
+#[derive(Debug)]
+pub struct Debouncer {
+    delay: Duration,
+    max_wait: Duration,
+    /// `(first_trigger, deadline)` of the pending run for each key
+    pending: Mutex<HashMap<String, (Instant, Instant)>>,
+}
+
+impl Debouncer {
+    pub fn new(delay: Duration, max_wait: Duration) -> Self {
+        Self {
+            delay,
+            max_wait: max_wait.max(delay),
+            pending: Mutex::new(HashMap::new()),
+        }
+    }
+
+    /// Register a trigger for `key`. The first caller becomes the only waiter for the
+    /// key; later callers just push its deadline back, never past `max_wait` after the
+    /// first trigger, and return `false`. The waiter returns `true` once its deadline
+    /// passes, or `false` if the pending run was cancelled in the meantime
+    pub async fn trigger(&self, key: &str) -> bool {
+        let now = Instant::now();
+        let mut deadline = now + self.delay;
+        {
+            let mut pending = self.pending.lock().await;
+            if let Some((first, next)) = pending.get_mut(key) {
+                *next = deadline.min(*first + self.max_wait);
+                return false;
+            }
+            pending.insert(key.to_string(), (now, deadline));
+        }
+
+        loop {
+            tokio::time::sleep_until(deadline).await;
+            let mut pending = self.pending.lock().await;
+            match pending.get(key) {
+                Some(&(_, next)) if next > deadline => deadline = next,
+                Some(_) => {
+                    pending.remove(key);
+                    return true;
+                }
+                None => return false,
+            }
+        }
+    }
+
+    /// Cancel the pending run for `key`, if any
+    pub async fn cancel(&self, key: &str) {
+        self.pending.lock().await.remove(key);
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::sync::Arc;
+
+    #[tokio::test]
+    async fn test_trigger_collapses_burst() {
+        let debouncer = Arc::new(Debouncer::new(
+            Duration::from_millis(50),
+            Duration::from_secs(5),
+        ));
+        let waiter = tokio::spawn({
+            let debouncer = debouncer.clone();
+            async move { debouncer.trigger("file:///A.sol").await }
+        });
+        tokio::time::sleep(Duration::from_millis(10)).await;
+        assert!(!debouncer.trigger("file:///A.sol").await);
+        assert!(!debouncer.trigger("file:///A.sol").await);
+        assert!(waiter.await.unwrap());
+    }
+
+    #[tokio::test]
+    async fn test_trigger_is_bounded_by_max_wait() {
+        let debouncer = Arc::new(Debouncer::new(
+            Duration::from_millis(40),
+            Duration::from_millis(100),
+        ));
+        let start = Instant::now();
+        let waiter = tokio::spawn({
+            let debouncer = debouncer.clone();
+            async move { debouncer.trigger("file:///A.sol").await }
+        });
+        tokio::time::sleep(Duration::from_millis(10)).await;
+        while !waiter.is_finished() {
+            debouncer.trigger("file:///A.sol").await;
+            tokio::time::sleep(Duration::from_millis(10)).await;
+        }
+        assert!(waiter.await.unwrap());
+        assert!(start.elapsed() < Duration::from_millis(400));
+    }
+
+    #[tokio::test]
+    async fn test_cancel() {
+        let debouncer = Arc::new(Debouncer::new(
+            Duration::from_millis(50),
+            Duration::from_secs(5),
+        ));
+        let waiter = tokio::spawn({
+            let debouncer = debouncer.clone();
+            async move { debouncer.trigger("file:///A.sol").await }
+        });
+        tokio::time::sleep(Duration::from_millis(10)).await;
+        debouncer.cancel("file:///A.sol").await;
+        assert!(!waiter.await.unwrap());
+    }
+}
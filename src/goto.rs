@@ -1,21 +1,99 @@
+use crate::{
+    references::{SourceFile, all_references},
+    utils::{LineIndex, SrcLocation},
+};
 use serde_json::Value;
-use std::collections::HashMap;
+use std::{
+    collections::HashMap,
+    path::Path,
+    sync::{Arc, Mutex},
+};
 use tower_lsp::lsp_types::{Location, Position, Range, Url};
 
+/// Per-node data kept for every AST node with an id, so it only holds what
+/// goto, references and rename read. Every field is a fixed-size value, keeping
+/// nodes free of heap allocations
 #[derive(Debug, Clone)]
 pub struct NodeInfo {
-    pub src: String,
-    pub name_location: Option<String>,
+    pub src: SrcLocation,
+    pub name_location: Option<SrcLocation>,
     pub referenced_declaration: Option<u64>,
-    pub node_type: Option<String>,
-    pub member_location: Option<String>,
 }
 
-fn push_if_node_or_array<'a>(tree: &'a Value, key: &str, stack: &mut Vec<&'a Value>) {
-    if let Some(value) = tree.get(key) {
+/// AST keys whose values hold child nodes that `cache_ids` descends into, sorted
+/// so they can be binary searched
+const CHILD_KEYS: &[&str] = &[
+    "arguments",
+    "baseContracts",
+    "baseExpression",
+    "baseName",
+    "baseType",
+    "block",
+    "body",
+    "components",
+    "condition",
+    "declarations",
+    "endExpression",
+    "errorCall",
+    "eventCall",
+    "expression",
+    "externalCall",
+    "falseBody",
+    "falseExpression",
+    "file",
+    "foreign",
+    "indexExpression",
+    "initialValue",
+    "initializationExpression",
+    "keyType",
+    "leftExpression",
+    "leftHandSide",
+    "libraryName",
+    "literals",
+    "loopExpression",
+    "members",
+    "modifierName",
+    "modifiers",
+    "name",
+    "names",
+    "nodes",
+    "options",
+    "overrides",
+    "parameters",
+    "pathNode",
+    "returnParameters",
+    "rightExpression",
+    "rightHandSide",
+    "startExpression",
+    "statements",
+    "storageLayout",
+    "subExpression",
+    "subdenomination",
+    "symbolAliases",
+    "trueBody",
+    "trueExpression",
+    "typeName",
+    "unitAlias",
+    "value",
+    "valueType",
+];
+
+/// Push the children `tree` holds under [`CHILD_KEYS`]. A node has far fewer fields
+/// than there are child keys, so its fields are gone through once instead of
+/// looking every child key up in it
+fn push_child_nodes<'a>(tree: &'a Value, stack: &mut Vec<&'a Value>) {
+    let Some(fields) = tree.as_object() else {
+        return;
+    };
+    for (key, value) in fields {
+        if CHILD_KEYS.binary_search(&key.as_str()).is_err() {
+            continue;
+        }
         match value {
+            // Arrays such as a pragma's `literals` hold plain strings, which have no
+            // id or children, so only objects are pushed
             Value::Array(arr) => {
-                stack.extend(arr);
+                stack.extend(arr.iter().filter(|item| item.is_object()));
             }
             Value::Object(_) => {
                 stack.push(value);
@@ -33,6 +111,9 @@ pub fn cache_ids(
 ) {
     let mut nodes: HashMap<String, HashMap<u64, NodeInfo>> = HashMap::new();
     let mut path_to_abs: HashMap<String, String> = HashMap::new();
+    // Every walk ends with the stack empty, so all sources share one buffer and it
+    // only grows to the deepest source instead of being reallocated for each one
+    let mut stack = Vec::new();
 
     if let Some(sources_obj) = sources.as_object() {
         for (path, contents) in sources_obj {
@@ -50,40 +131,24 @@ pub fn cache_ids(
 
                 path_to_abs.insert(path.clone(), abs_path.clone());
 
-                // Initialize the nodes map for this file
-                if !nodes.contains_key(&abs_path) {
-                    nodes.insert(abs_path.clone(), HashMap::new());
-                }
-
-                if let Some(id) = ast.get("id").and_then(|v| v.as_u64())
-                    && let Some(src) = ast.get("src").and_then(|v| v.as_str())
-                {
-                    nodes.get_mut(&abs_path).unwrap().insert(
-                        id,
-                        NodeInfo {
-                            src: src.to_string(),
-                            name_location: None,
-                            referenced_declaration: None,
-                            node_type: ast
-                                .get("nodeType")
-                                .and_then(|v| v.as_str())
-                                .map(|s| s.to_string()),
-                            member_location: None,
-                        },
-                    );
-                }
-
-                let mut stack = vec![ast];
+                // Get or create the nodes map for this file in a single lookup, once
+                // rather than for every node. The root node itself is recorded by
+                // the first iteration of the walk
+                let file_nodes = nodes.entry(abs_path).or_default();
+                stack.push(ast);
 
                 while let Some(tree) = stack.pop() {
                     if let Some(id) = tree.get("id").and_then(|v| v.as_u64())
-                        && let Some(src) = tree.get("src").and_then(|v| v.as_str())
+                        && let Some(src) = tree
+                            .get("src")
+                            .and_then(|v| v.as_str())
+                            .and_then(SrcLocation::parse)
                     {
                         // Check for nameLocation first
                         let mut name_location = tree
                             .get("nameLocation")
                             .and_then(|v| v.as_str())
-                            .map(|s| s.to_string());
+                            .and_then(SrcLocation::parse);
 
                         // Check for nameLocations array and use appropriate element
                         // For IdentifierPath (qualified names like D.State), use the last element (the actual identifier)
@@ -98,94 +163,25 @@ pub fn cache_ids(
                                 name_location = locations_array
                                     .last()
                                     .and_then(|v| v.as_str())
-                                    .map(|s| s.to_string());
+                                    .and_then(SrcLocation::parse);
                             } else {
-                                name_location = locations_array[0].as_str().map(|s| s.to_string());
+                                name_location =
+                                    locations_array[0].as_str().and_then(SrcLocation::parse);
                             }
                         }
 
                         let node_info = NodeInfo {
-                            src: src.to_string(),
+                            src,
                             name_location,
                             referenced_declaration: tree
                                 .get("referencedDeclaration")
                                 .and_then(|v| v.as_u64()),
-                            node_type: tree
-                                .get("nodeType")
-                                .and_then(|v| v.as_str())
-                                .map(|s| s.to_string()),
-                            member_location: tree
-                                .get("memberLocation")
-                                .and_then(|v| v.as_str())
-                                .map(|s| s.to_string()),
                         };
 
-                        nodes.get_mut(&abs_path).unwrap().insert(id, node_info);
+                        file_nodes.insert(id, node_info);
                     }
 
-                    push_if_node_or_array(tree, "arguments", &mut stack);
-                    push_if_node_or_array(tree, "arguments", &mut stack);
-                    push_if_node_or_array(tree, "baseContracts", &mut stack);
-                    push_if_node_or_array(tree, "baseContracts", &mut stack);
-                    push_if_node_or_array(tree, "baseExpression", &mut stack);
-                    push_if_node_or_array(tree, "baseName", &mut stack);
-                    push_if_node_or_array(tree, "baseType", &mut stack);
-                    push_if_node_or_array(tree, "block", &mut stack);
-                    push_if_node_or_array(tree, "body", &mut stack);
-                    push_if_node_or_array(tree, "components", &mut stack);
-                    push_if_node_or_array(tree, "components", &mut stack);
-                    push_if_node_or_array(tree, "condition", &mut stack);
-                    push_if_node_or_array(tree, "declarations", &mut stack);
-                    push_if_node_or_array(tree, "endExpression", &mut stack);
-                    push_if_node_or_array(tree, "errorCall", &mut stack);
-                    push_if_node_or_array(tree, "eventCall", &mut stack);
-                    push_if_node_or_array(tree, "expression", &mut stack);
-                    push_if_node_or_array(tree, "externalCall", &mut stack);
-                    push_if_node_or_array(tree, "falseBody", &mut stack);
-                    push_if_node_or_array(tree, "falseExpression", &mut stack);
-                    push_if_node_or_array(tree, "file", &mut stack);
-                    push_if_node_or_array(tree, "foreign", &mut stack);
-                    push_if_node_or_array(tree, "indexExpression", &mut stack);
-                    push_if_node_or_array(tree, "initialValue", &mut stack);
-                    push_if_node_or_array(tree, "initialValue", &mut stack);
-                    push_if_node_or_array(tree, "initializationExpression", &mut stack);
-                    push_if_node_or_array(tree, "keyType", &mut stack);
-                    push_if_node_or_array(tree, "leftExpression", &mut stack);
-                    push_if_node_or_array(tree, "leftHandSide", &mut stack);
-                    push_if_node_or_array(tree, "libraryName", &mut stack);
-                    push_if_node_or_array(tree, "literals", &mut stack);
-                    push_if_node_or_array(tree, "loopExpression", &mut stack);
-                    push_if_node_or_array(tree, "members", &mut stack);
-                    push_if_node_or_array(tree, "modifierName", &mut stack);
-                    push_if_node_or_array(tree, "modifiers", &mut stack);
-                    push_if_node_or_array(tree, "name", &mut stack);
-                    push_if_node_or_array(tree, "names", &mut stack);
-                    push_if_node_or_array(tree, "nodes", &mut stack);
-                    push_if_node_or_array(tree, "options", &mut stack);
-                    push_if_node_or_array(tree, "options", &mut stack);
-                    push_if_node_or_array(tree, "options", &mut stack);
-                    push_if_node_or_array(tree, "overrides", &mut stack);
-                    push_if_node_or_array(tree, "overrides", &mut stack);
-                    push_if_node_or_array(tree, "parameters", &mut stack);
-                    push_if_node_or_array(tree, "parameters", &mut stack);
-                    push_if_node_or_array(tree, "pathNode", &mut stack);
-                    push_if_node_or_array(tree, "returnParameters", &mut stack);
-                    push_if_node_or_array(tree, "returnParameters", &mut stack);
-                    push_if_node_or_array(tree, "rightExpression", &mut stack);
-                    push_if_node_or_array(tree, "rightHandSide", &mut stack);
-                    push_if_node_or_array(tree, "startExpression", &mut stack);
-                    push_if_node_or_array(tree, "statements", &mut stack);
-                    push_if_node_or_array(tree, "statements", &mut stack);
-                    push_if_node_or_array(tree, "storageLayout", &mut stack);
-                    push_if_node_or_array(tree, "subExpression", &mut stack);
-                    push_if_node_or_array(tree, "subdenomination", &mut stack);
-                    push_if_node_or_array(tree, "symbolAliases", &mut stack);
-                    push_if_node_or_array(tree, "trueBody", &mut stack);
-                    push_if_node_or_array(tree, "trueExpression", &mut stack);
-                    push_if_node_or_array(tree, "typeName", &mut stack);
-                    push_if_node_or_array(tree, "unitAlias", &mut stack);
-                    push_if_node_or_array(tree, "value", &mut stack);
-                    push_if_node_or_array(tree, "valueType", &mut stack);
+                    push_child_nodes(tree, &mut stack);
                 }
             }
         }
@@ -194,126 +190,237 @@ pub fn cache_ids(
     (nodes, path_to_abs)
 }
 
-pub fn goto_bytes(
-    nodes: &HashMap<String, HashMap<u64, NodeInfo>>,
-    path_to_abs: &HashMap<String, String>,
-    id_to_path: &HashMap<String, String>,
-    uri: &str,
-    position: usize,
-) -> Option<(String, usize)> {
-    let path = match uri.starts_with("file://") {
-        true => &uri[7..],
-        false => uri,
-    };
+pub fn pos_to_bytes(source_bytes: &[u8], position: Position) -> usize {
+    // Skip to the cursor's line by scanning the raw bytes for newlines, without
+    // decoding the document or splitting it into lines first
+    let mut line_start = 0;
+    for _ in 0..position.line {
+        match source_bytes[line_start..].iter().position(|&b| b == b'\n') {
+            Some(newline) => line_start += newline + 1,
+            None => return source_bytes.len(),
+        }
+    }
 
-    // Get absolute path for this file
-    let abs_path = path_to_abs.get(path)?;
+    let line = &source_bytes[line_start..];
+    let mut line_len = line.iter().position(|&b| b == b'\n').unwrap_or(line.len());
+    if line[..line_len].ends_with(b"\r") {
+        line_len -= 1;
+    }
 
-    // Get nodes for the current file only
-    let current_file_nodes = nodes.get(abs_path)?;
+    line_start + std::cmp::min(position.character as usize, line_len)
+}
 
-    let mut refs = HashMap::new();
+/// Spans of one file's nodes as parallel arrays, so that cursor lookups scan
+/// contiguous integers instead of iterating the file's node map. The arrays never
+/// change once built, so they are boxed slices without spare capacity
+#[derive(Debug)]
+struct FileSpans {
+    ids: Box<[u64]>,
+    starts: Box<[usize]>,
+    ends: Box<[usize]>,
+}
 
-    // Only consider nodes from the current file that have references
-    for (id, content) in current_file_nodes {
-        if content.referenced_declaration.is_none() {
-            continue;
+impl FileSpans {
+    fn new<'a>(file_nodes: impl IntoIterator<Item = (&'a u64, &'a NodeInfo)>) -> Self {
+        let (mut ids, mut starts, mut ends) = (Vec::new(), Vec::new(), Vec::new());
+        for (&id, node) in file_nodes {
+            ids.push(id);
+            starts.push(node.src.start());
+            ends.push(node.src.end());
         }
-
-        let src_parts: Vec<&str> = content.src.split(':').collect();
-        if src_parts.len() != 3 {
-            continue;
+        Self {
+            ids: ids.into_boxed_slice(),
+            starts: starts.into_boxed_slice(),
+            ends: ends.into_boxed_slice(),
         }
+    }
 
-        let start_b: usize = src_parts[0].parse().ok()?;
-        let length: usize = src_parts[1].parse().ok()?;
-        let end_b = start_b + length;
+    /// Position in the arrays of the shortest span containing `byte_position`. Of
+    /// equally long spans the one with the larger id wins
+    fn closest(&self, byte_position: usize) -> Option<usize> {
+        let mut closest: Option<(usize, u64, usize)> = None;
 
-        if start_b <= position && position < end_b {
-            let diff = end_b - start_b;
-            if !refs.contains_key(&diff) || refs[&diff] <= *id {
-                refs.insert(diff, *id);
+        // Walk the three arrays in step rather than indexing two of them by position
+        let spans = self.ids.iter().zip(&self.starts).zip(&self.ends);
+        for (i, ((&id, &start), &end)) in spans.enumerate() {
+            if byte_position < start || end <= byte_position {
+                continue;
+            }
+            let diff = end - start;
+            if closest.is_none_or(|(min_diff, min_id, _)| {
+                diff < min_diff || (diff == min_diff && min_id <= id)
+            }) {
+                closest = Some((diff, id, i));
             }
         }
+
+        closest.map(|(_, _, i)| i)
     }
+}
+
+/// Spans of one file's nodes that reference a declaration, with the id each one
+/// references in one more parallel array. Goto reads nothing else of the node it
+/// lands on, so it never has to look the node up
+#[derive(Debug)]
+struct ReferenceSpans {
+    spans: FileSpans,
+    declarations: Box<[u64]>,
+}
 
-    if refs.is_empty() {
-        return None;
+impl ReferenceSpans {
+    fn new(file_nodes: &HashMap<u64, NodeInfo>) -> Self {
+        let referencing: Vec<_> = file_nodes
+            .iter()
+            .filter_map(|(id, node)| Some((id, node, node.referenced_declaration?)))
+            .collect();
+        Self {
+            spans: FileSpans::new(referencing.iter().map(|&(id, node, _)| (id, node))),
+            declarations: referencing.iter().map(|&(_, _, target)| target).collect(),
+        }
     }
+}
 
-    // Find the reference with minimum diff (most specific)
-    let min_diff = *refs.keys().min()?;
-    let chosen_id = refs[&min_diff];
+/// Lookup tables that goto, references and rename derive from a build's AST.
+/// Building them walks every node of every source, so callers that answer several
+/// requests from the same AST build them once and keep them next to it
+#[derive(Debug)]
+pub struct AstIndex {
+    /// Nodes of every file by id. Node ids are unique across a build, so one map
+    /// holds them all and the files they belong to are only kept in `spans`
+    pub nodes: HashMap<u64, NodeInfo>,
+    /// Absolute path of each source key. Each absolute path is allocated once and
+    /// shared with the keys of `spans` and `reference_spans`
+    pub path_to_abs: HashMap<String, Arc<str>>,
+    pub id_to_path: HashMap<String, String>,
+    /// Ids linked to each node id by a `referencedDeclaration`, in either direction
+    pub references: HashMap<u64, Box<[u64]>>,
+    /// Node spans of each file, keyed by absolute path
+    spans: HashMap<Arc<str>, FileSpans>,
+    /// Spans of just the nodes with a `referencedDeclaration`, keyed the same way.
+    /// Goto only ever looks for those, so they are bucketed once here instead of
+    /// being filtered out of every node of the file on each request
+    reference_spans: HashMap<Arc<str>, ReferenceSpans>,
+    /// Sources already read to convert spans to locations, by file id. The line
+    /// tables are built once per build rather than once per request, and the
+    /// build's offsets only hold for the content it compiled anyway
+    source_files: Mutex<HashMap<i32, Option<Arc<SourceFile>>>>,
+    /// Locations already found for the references of each target node, by its id.
+    /// References and rename requests from any usage of a symbol land on the same
+    /// target, so its spans are converted to ranges once per build
+    reference_locations: Mutex<HashMap<u64, Vec<Location>>>,
+}
 
-    // Get the referenced declaration ID
-    let ref_id = current_file_nodes[&chosen_id].referenced_declaration?;
+impl AstIndex {
+    /// Index `ast_data`, or `None` if it lacks the sources or build info to resolve
+    /// locations with
+    pub fn new(ast_data: &Value) -> Option<Self> {
+        let sources = ast_data.get("sources")?;
+        let build_infos = ast_data.get("build_infos")?.as_array()?;
+        let first_build_info = build_infos.first()?;
+        let id_to_path = first_build_info.get("source_id_to_path")?.as_object()?;
 
-    // Search for the referenced declaration across all files
-    let mut target_node: Option<&NodeInfo> = None;
-    for file_nodes in nodes.values() {
-        if let Some(node) = file_nodes.get(&ref_id) {
-            target_node = Some(node);
-            break;
+        let id_to_path = id_to_path
+            .iter()
+            .map(|(k, v)| (k.clone(), v.as_str().unwrap_or("").to_string()))
+            .collect();
+        let (files, path_to_abs) = cache_ids(sources);
+        let references = all_references(&files)
+            .into_iter()
+            .map(|(id, refs)| (id, refs.into_boxed_slice()))
+            .collect();
+
+        let mut nodes = HashMap::with_capacity(files.values().map(HashMap::len).sum());
+        let mut spans = HashMap::with_capacity(files.len());
+        let mut reference_spans = HashMap::with_capacity(files.len());
+        for (abs_path, file_nodes) in files {
+            let abs_path: Arc<str> = abs_path.into();
+            reference_spans.insert(abs_path.clone(), ReferenceSpans::new(&file_nodes));
+            spans.insert(abs_path, FileSpans::new(&file_nodes));
+            nodes.extend(file_nodes);
         }
+        // Every absolute path is a key of `spans` already, so point at that copy
+        let path_to_abs = path_to_abs
+            .into_iter()
+            .map(|(path, abs_path)| {
+                let abs_path = match spans.get_key_value(abs_path.as_str()) {
+                    Some((interned, _)) => Arc::clone(interned),
+                    None => abs_path.into(),
+                };
+                (path, abs_path)
+            })
+            .collect();
+
+        Some(Self {
+            nodes,
+            path_to_abs,
+            id_to_path,
+            references,
+            spans,
+            reference_spans,
+            source_files: Mutex::default(),
+            reference_locations: Mutex::default(),
+        })
     }
 
-    let node = target_node?;
+    /// Id of the most specific (shortest) node of the file at `abs_path` whose span
+    /// contains `byte_position`. Of equally long spans the one with the larger id wins
+    pub fn node_at(&self, abs_path: &str, byte_position: usize) -> Option<u64> {
+        let spans = self.spans.get(abs_path)?;
+        spans.closest(byte_position).map(|i| spans.ids[i])
+    }
 
-    // Get location from nameLocation or src
-    let (location_str, file_id) = if let Some(name_location) = &node.name_location {
-        let parts: Vec<&str> = name_location.split(':').collect();
-        if parts.len() == 3 {
-            (parts[0], parts[2])
-        } else {
-            return None;
-        }
-    } else {
-        let parts: Vec<&str> = node.src.split(':').collect();
-        if parts.len() == 3 {
-            (parts[0], parts[2])
-        } else {
-            return None;
-        }
-    };
+    /// Id of the declaration referenced by the node [`AstIndex::node_at`] would find
+    /// among only the nodes that reference one
+    pub fn declaration_at(&self, abs_path: &str, byte_position: usize) -> Option<u64> {
+        let references = self.reference_spans.get(abs_path)?;
+        references
+            .spans
+            .closest(byte_position)
+            .map(|i| references.declarations[i])
+    }
 
-    let location: usize = location_str.parse().ok()?;
-    let file_path = id_to_path.get(file_id)?.clone();
+    /// Source file with `file_id`, read the first time one of its spans is located
+    pub fn source_file(&self, file_id: i32) -> Option<Arc<SourceFile>> {
+        if let Ok(source_files) = self.source_files.lock()
+            && let Some(source_file) = source_files.get(&file_id)
+        {
+            return source_file.clone();
+        }
 
-    Some((file_path, location))
-}
-pub fn pos_to_bytes(source_bytes: &[u8], position: Position) -> usize {
-    let text = String::from_utf8_lossy(source_bytes);
-    let lines: Vec<&str> = text.lines().collect();
-
-    let mut byte_offset = 0;
-
-    for (line_num, line_text) in lines.iter().enumerate() {
-        if line_num < position.line as usize {
-            byte_offset += line_text.len() + 1; // +1 for newline
-        } else if line_num == position.line as usize {
-            let char_offset = std::cmp::min(position.character as usize, line_text.len());
-            byte_offset += char_offset;
-            break;
+        let source_file = self
+            .id_to_path
+            .get(&file_id.to_string())
+            .and_then(|file_path| SourceFile::read(file_path))
+            .map(Arc::new);
+        if let Ok(mut source_files) = self.source_files.lock() {
+            source_files.insert(file_id, source_file.clone());
         }
+        source_file
     }
 
-    byte_offset
-}
-
-pub fn bytes_to_pos(source_bytes: &[u8], byte_offset: usize) -> Option<Position> {
-    let text = String::from_utf8_lossy(source_bytes);
-    let mut curr_offset = 0;
+    /// Locations of the references to `target`, found with `locate` the first time
+    pub fn reference_locations(
+        &self,
+        target: u64,
+        locate: impl FnOnce() -> Vec<Location>,
+    ) -> Vec<Location> {
+        if let Ok(reference_locations) = self.reference_locations.lock()
+            && let Some(locations) = reference_locations.get(&target)
+        {
+            return locations.clone();
+        }
 
-    for (line_num, line_text) in text.lines().enumerate() {
-        let line_bytes = line_text.len() + 1; // +1 for newline
-        if curr_offset + line_bytes > byte_offset {
-            let col = byte_offset - curr_offset;
-            return Some(Position::new(line_num as u32, col as u32));
+        let locations = locate();
+        if let Ok(mut reference_locations) = self.reference_locations.lock() {
+            reference_locations.insert(target, locations.clone());
         }
-        curr_offset += line_bytes;
+        locations
     }
 
-    None
+    /// Node with `id`, in whichever file it is
+    pub fn node(&self, id: u64) -> Option<&NodeInfo> {
+        self.nodes.get(&id)
+    }
 }
 
 pub fn goto_declaration(
@@ -322,47 +429,42 @@ pub fn goto_declaration(
     position: Position,
     source_bytes: &[u8],
 ) -> Option<Location> {
-    let sources = ast_data.get("sources")?;
-    let build_infos = ast_data.get("build_infos")?.as_array()?;
-    let first_build_info = build_infos.first()?;
-    let id_to_path = first_build_info.get("source_id_to_path")?.as_object()?;
-
-    let id_to_path_map: HashMap<String, String> = id_to_path
-        .iter()
-        .map(|(k, v)| (k.clone(), v.as_str().unwrap_or("").to_string()))
-        .collect();
-
-    let (nodes, path_to_abs) = cache_ids(sources);
     let byte_position = pos_to_bytes(source_bytes, position);
-
-    if let Some((file_path, location_bytes)) = goto_bytes(
-        &nodes,
-        &path_to_abs,
-        &id_to_path_map,
-        file_uri.as_ref(),
+    // Decode the URI to the path the AST knows the file by, so percent-encoded
+    // characters such as spaces still match. A URI that isn't a file path matches
+    // no source and falls back to the cursor
+    let file_path = file_uri.to_file_path().unwrap_or_default();
+    goto_declaration_in(
+        &AstIndex::new(ast_data)?,
+        file_uri,
+        &file_path,
+        position,
         byte_position,
-    ) {
-        // Read the target file to convert byte position to line/column
-        let target_file_path = std::path::Path::new(&file_path);
-
-        // Make the path absolute if it's relative
-        let absolute_path = if target_file_path.is_absolute() {
-            target_file_path.to_path_buf()
-        } else {
-            std::env::current_dir().ok()?.join(target_file_path)
-        };
+    )
+}
 
-        if let Ok(target_source_bytes) = std::fs::read(&absolute_path)
-            && let Some(target_position) = bytes_to_pos(&target_source_bytes, location_bytes)
-            && let Ok(target_uri) = Url::from_file_path(&absolute_path)
+/// [`goto_declaration`] against an already built [`AstIndex`], for a cursor already
+/// converted to its byte offset in `file_path`, the document `file_uri` decodes to
+pub fn goto_declaration_in(
+    index: &AstIndex,
+    file_uri: &Url,
+    file_path: &Path,
+    position: Position,
+    byte_position: usize,
+) -> Option<Location> {
+    if let Some(path) = file_path.to_str()
+        && let Some(abs_path) = index.path_to_abs.get(path)
+        && let Some(ref_id) = index.declaration_at(abs_path, byte_position)
+        && let Some(target_node) = index.node(ref_id)
+    {
+        // The target file's uri and line table are built once per index and shared by
+        // every lookup that lands in it
+        let name = target_node.name_location.unwrap_or(target_node.src);
+        if let Some(location) = index
+            .source_file(name.file_id())
+            .and_then(|file| file.location(name.start(), 0))
         {
-            return Some(Location {
-                uri: target_uri,
-                range: Range {
-                    start: target_position,
-                    end: target_position,
-                },
-            });
+            return Some(location);
         }
     }
 
@@ -398,17 +500,18 @@ mod tests {
     }
 
     #[test]
-    fn test_bytes_to_pos() {
-        let source = b"line1\nline2\nline3";
+    fn test_line_index_position() {
+        let source = "line1\nline2\nline3";
+        let lines = LineIndex::new(source);
 
         // Test byte offset 0
-        assert_eq!(bytes_to_pos(source, 0), Some(Position::new(0, 0)));
+        assert_eq!(lines.position(0), (0, 0));
 
         // Test byte offset at start of second line
-        assert_eq!(bytes_to_pos(source, 6), Some(Position::new(1, 0)));
+        assert_eq!(lines.position(6), (1, 0));
 
         // Test byte offset in middle of first line
-        assert_eq!(bytes_to_pos(source, 2), Some(Position::new(0, 2)));
+        assert_eq!(lines.position(2), (0, 2));
     }
 
     fn get_ast_data() -> Option<serde_json::Value> {
@@ -600,7 +703,7 @@ mod tests {
         // Check that nodes have the expected structure
         nodes.iter().for_each(|(_file_path, file_nodes)| {
             for node_info in file_nodes.values() {
-                assert!(!node_info.src.is_empty());
+                assert!(node_info.src.start() <= node_info.src.end());
                 // Some nodes should have referenced declarations
                 if node_info.referenced_declaration.is_some() {}
             }
@@ -608,7 +711,7 @@ mod tests {
     }
 
     #[test]
-    fn test_goto_bytes_functionality() {
+    fn test_declaration_at_functionality() {
         let ast_data = match get_ast_data() {
             Some(data) => data,
             None => {
@@ -616,42 +719,28 @@ mod tests {
             }
         };
 
-        let sources = ast_data.get("sources").unwrap();
-        let build_infos = ast_data.get("build_infos").unwrap().as_array().unwrap();
-        let first_build_info = build_infos.first().unwrap();
-        let id_to_path = first_build_info
-            .get("source_id_to_path")
-            .unwrap()
-            .as_object()
-            .unwrap();
-
-        let id_to_path_map: HashMap<String, String> = id_to_path
-            .iter()
-            .map(|(k, v)| (k.clone(), v.as_str().unwrap_or("").to_string()))
-            .collect();
-
-        let (nodes, path_to_abs) = cache_ids(sources);
+        let index = AstIndex::new(&ast_data).unwrap();
         let source_bytes = std::fs::read("testdata/C.sol").unwrap();
 
         // Test with a position that should have a reference
         let position = Position::new(21, 8); // "name" in add_vote function
         let byte_position = pos_to_bytes(&source_bytes, position);
 
-        let file_uri_url = get_test_file_uri("testdata/C.sol");
-        let file_uri = file_uri_url.as_str();
-        let result = goto_bytes(
-            &nodes,
-            &path_to_abs,
-            &id_to_path_map,
-            file_uri,
-            byte_position,
-        );
-
-        // Should find a declaration
-        if let Some((file_path, _location_bytes)) = result {
-            assert!(!file_path.is_empty());
+        let file_path = get_test_file_uri("testdata/C.sol").to_file_path().unwrap();
+        let target = index
+            .path_to_abs
+            .get(file_path.to_str().unwrap())
+            .and_then(|abs_path| index.declaration_at(abs_path, byte_position))
+            .and_then(|ref_id| index.node(ref_id));
+
+        // Should find a declaration in one of the build's files
+        if let Some(node) = target {
+            let location = node.name_location.unwrap_or(node.src);
+            let file_path = index.id_to_path.get(&location.file_id().to_string());
+            assert!(file_path.is_some_and(|path| !path.is_empty()));
         }
     }
+
     #[test]
     fn test_goto_declaration_and_definition_consistency() {
         let ast_data = match get_ast_data() {
@@ -794,11 +883,68 @@ mod tests {
         // Node 2 should have nameLocation from nameLocations[0]
         assert!(test_file_nodes.contains_key(&2));
         let node2 = &test_file_nodes[&2];
-        assert_eq!(node2.name_location, Some("15:8:0".to_string()));
+        assert_eq!(node2.name_location, SrcLocation::parse("15:8:0"));
 
         // Node 3 should have nameLocation from nameLocation field
         assert!(test_file_nodes.contains_key(&3));
         let node3 = &test_file_nodes[&3];
-        assert_eq!(node3.name_location, Some("35:5:0".to_string()));
+        assert_eq!(node3.name_location, SrcLocation::parse("35:5:0"));
+    }
+
+    #[test]
+    fn test_child_keys_sorted() {
+        assert!(CHILD_KEYS.windows(2).all(|pair| pair[0] < pair[1]));
+    }
+
+    #[test]
+    fn test_node_at() {
+        use serde_json::json;
+
+        let ast_data = json!({
+            "sources": {
+                "test.sol": [{
+                    "source_file": {
+                        "ast": {
+                            "id": 1,
+                            "src": "0:100:0",
+                            "nodeType": "SourceUnit",
+                            "absolutePath": "test.sol",
+                            "nodes": [{
+                                "id": 2,
+                                "src": "10:20:0",
+                                "nodeType": "ExpressionStatement",
+                                "expression": {
+                                    "id": 3,
+                                    "src": "12:5:0",
+                                    "nodeType": "Identifier",
+                                    "referencedDeclaration": 4
+                                }
+                            }, {
+                                "id": 4,
+                                "src": "40:10:0",
+                                "nodeType": "VariableDeclaration"
+                            }]
+                        }
+                    }
+                }]
+            },
+            "build_infos": [{ "source_id_to_path": { "0": "test.sol" } }]
+        });
+
+        let index = AstIndex::new(&ast_data).unwrap();
+
+        // The shortest span containing the offset wins
+        assert_eq!(index.node_at("test.sol", 14), Some(3));
+        assert_eq!(index.node_at("test.sol", 20), Some(2));
+        assert_eq!(index.node_at("test.sol", 45), Some(4));
+        assert_eq!(index.node_at("test.sol", 5), Some(1));
+
+        // Spans are half-open
+        assert_eq!(index.node_at("test.sol", 17), Some(2));
+
+        // Only nodes that reference a declaration are considered
+        assert_eq!(index.declaration_at("test.sol", 14), Some(4));
+        assert_eq!(index.declaration_at("test.sol", 20), None);
+        assert_eq!(index.node_at("other.sol", 14), None);
     }
 }
@@ -7,6 +7,7 @@
 
 pub mod build;
 pub mod cli;
+pub mod debounce;
 pub mod goto;
 pub mod lint;
 pub mod lsp;
@@ -1,25 +1,43 @@
+use crate::build::diagnostic_severity;
 use serde::{Deserialize, Serialize};
-use std::path::Path;
-use tower_lsp::lsp_types::{Diagnostic, DiagnosticSeverity, Position, Range};
+use std::{collections::HashMap, path::Path};
+use tower_lsp::lsp_types::{Diagnostic, Position, Range};
 
 pub fn lint_output_to_diagnostics(
     forge_output: &serde_json::Value,
     target_file: &str,
 ) -> Vec<Diagnostic> {
     let mut diagnostics = Vec::new();
+    // The target is the same for every span, so resolve it once
+    let target_path = Path::new(target_file)
+        .canonicalize()
+        .unwrap_or_else(|_| Path::new(target_file).to_path_buf());
+    // The spans of one run name only a few files, so each name is canonicalized
+    // once and its comparison with the target reused for later spans
+    let mut is_target: HashMap<String, bool> = HashMap::new();
 
     if let serde_json::Value::Array(items) = forge_output {
         for item in items {
-            if let Ok(forge_diag) = serde_json::from_value::<ForgeDiagnostic>(item.clone()) {
+            // Deserialize straight from the borrowed value instead of cloning the
+            // whole JSON tree of every diagnostic first
+            if let Ok(forge_diag) = ForgeDiagnostic::deserialize(item) {
                 // Only include diagnostics for the target file
                 for span in &forge_diag.spans {
-                    let target_path = Path::new(target_file)
-                        .canonicalize()
-                        .unwrap_or_else(|_| Path::new(target_file).to_path_buf());
-                    let span_path = Path::new(&span.file_name)
-                        .canonicalize()
-                        .unwrap_or_else(|_| Path::new(&span.file_name).to_path_buf());
-                    if target_path == span_path && span.is_primary {
+                    if !span.is_primary {
+                        continue;
+                    }
+                    let in_target = match is_target.get(&span.file_name) {
+                        Some(&in_target) => in_target,
+                        None => {
+                            let span_path = Path::new(&span.file_name)
+                                .canonicalize()
+                                .unwrap_or_else(|_| Path::new(&span.file_name).to_path_buf());
+                            let in_target = target_path == span_path;
+                            is_target.insert(span.file_name.clone(), in_target);
+                            in_target
+                        }
+                    };
+                    if in_target {
                         let diagnostic = Diagnostic {
                             range: Range {
                                 start: Position {
@@ -31,13 +49,7 @@ pub fn lint_output_to_diagnostics(
                                     character: (span.column_end - 1),
                                 },
                             },
-                            severity: Some(match forge_diag.level.as_str() {
-                                "error" => DiagnosticSeverity::ERROR,
-                                "warning" => DiagnosticSeverity::WARNING,
-                                "note" => DiagnosticSeverity::INFORMATION,
-                                "help" => DiagnosticSeverity::HINT,
-                                _ => DiagnosticSeverity::INFORMATION,
-                            }),
+                            severity: Some(diagnostic_severity(&forge_diag.level)),
                             code: forge_diag.code.as_ref().map(|c| {
                                 tower_lsp::lsp_types::NumberOrString::String(c.code.clone())
                             }),
@@ -1,41 +1,199 @@
 use crate::{
+    debounce::Debouncer,
     goto, references, rename, symbols,
     runner::{ForgeRunner, Runner},
-    utils,
+    utils::{self, LineIndex},
+};
+use std::{
+    collections::{HashMap, HashSet},
+    path::{Path, PathBuf},
+    sync::{
+        Arc, OnceLock,
+        atomic::{AtomicBool, Ordering},
+    },
+    time::Duration,
+};
+use tokio::{
+    sync::{Mutex, RwLock, Semaphore, mpsc},
+    task::JoinSet,
 };
-use std::{collections::HashMap, sync::Arc};
-use tokio::sync::RwLock;
 use tower_lsp::{Client, LanguageServer, lsp_types::*};
+use tracing::debug;
 
 pub type FileId = usize;
 
-fn byte_offset(content: &str, position: Position) -> Result<usize, String> {
-    let lines: Vec<&str> = content.lines().collect();
-    if position.line as usize >= lines.len() {
-        return Err("Line out of range".to_string());
-    }
-    let mut offset = 0;
-    (0..position.line as usize).for_each(|i| {
-        offset += lines[i].len() + 1; // +1 for \n
-    });
-    offset += position.character as usize;
-    if offset > content.len() {
+const SERVER_NAME: &str = "forge lsp";
+const SERVER_VERSION: &str = env!("CARGO_PKG_VERSION");
+
+/// Quiet period after a save before diagnostics run, so bursts of saves
+/// (format-on-save, auto-save) collapse into a single forge invocation
+const DIAGNOSTICS_DEBOUNCE_DELAY: Duration = Duration::from_millis(300);
+
+/// Longest a continuous burst of saves can postpone diagnostics
+const DIAGNOSTICS_MAX_WAIT: Duration = Duration::from_millis(1500);
+
+/// Most forge processes run at once. Builds of one project share its `out/` and
+/// cache directories, so every extra concurrent build contends for the same files
+const MAX_CONCURRENT_FORGE_RUNS: usize = 4;
+
+fn byte_offset(lines: &LineIndex, position: Position) -> Result<usize, String> {
+    let line_start = lines
+        .line_start(position.line)
+        .ok_or_else(|| "Line out of range".to_string())?;
+    let offset = line_start + position.character as usize;
+    if offset > lines.len() {
         return Err("Character out of range".to_string());
     }
     Ok(offset)
 }
 
+/// Run `f` on tokio's blocking pool. Resolving a position against the AST reads
+/// source files with `std::fs`, which would otherwise stall the runtime worker a
+/// request handler runs on
+async fn run_blocking<T: Send + 'static>(f: impl FnOnce() -> T + Send + 'static) -> Option<T> {
+    tokio::task::spawn_blocking(f).await.ok()
+}
+
+/// Capabilities advertised in the `initialize` response
+fn server_capabilities() -> ServerCapabilities {
+    ServerCapabilities {
+        definition_provider: Some(OneOf::Left(true)),
+        declaration_provider: Some(DeclarationCapability::Simple(true)),
+        references_provider: Some(OneOf::Left(true)),
+        rename_provider: Some(OneOf::Left(true)),
+        workspace_symbol_provider: Some(OneOf::Left(true)),
+        document_symbol_provider: Some(OneOf::Left(true)),
+        text_document_sync: Some(TextDocumentSyncCapability::Kind(TextDocumentSyncKind::FULL)),
+        diagnostic_provider: Some(DiagnosticServerCapabilities::Options(DiagnosticOptions {
+            identifier: Some("forge".to_string()),
+            inter_file_dependencies: true,
+            workspace_diagnostics: false,
+            work_done_progress_options: WorkDoneProgressOptions::default(),
+        })),
+        ..ServerCapabilities::default()
+    }
+}
+
+#[derive(Clone)]
 pub struct ForgeLsp {
     client: Client,
     compiler: Arc<dyn Runner>,
-    ast_cache: Arc<RwLock<HashMap<String, serde_json::Value>>>,
+    /// forge build output with the AST of each document, stored as
+    /// `(content_hash, ast)` and shared so requests don't deep-copy it
+    ast_cache: Arc<RwLock<HashMap<String, (String, Arc<CachedAst>)>>>,
+    /// Lock of each URI, held while its AST missing from the cache is fetched, so
+    /// requests arriving together for the same document wait for that forge run
+    /// instead of each starting their own. Fetches for other documents don't wait
+    ast_fetch: Arc<Mutex<HashMap<String, Arc<Mutex<()>>>>>,
+    /// Permits to run forge, shared by the diagnostics worker, AST fetches and
+    /// workspace symbol builds, see [`MAX_CONCURRENT_FORGE_RUNS`]
+    forge_runs: Arc<Semaphore>,
+    /// Workspace root reported by the client in `initialize`
+    workspace_root: Arc<OnceLock<PathBuf>>,
+    /// Diagnostics keyed by URI, stored as `(result_id, diagnostics)`. The list is
+    /// shared so cache hits don't deep-copy it under the lock
+    diagnostics_cache: Arc<RwLock<HashMap<String, (String, Arc<Vec<Diagnostic>>)>>>,
+    /// Diagnostics last published to the client for each URI
+    published_diagnostics: Arc<RwLock<HashMap<String, Arc<Vec<Diagnostic>>>>>,
+    /// Whether the client pulls diagnostics (`textDocument/diagnostic`) instead of
+    /// receiving them through `textDocument/publishDiagnostics`
+    pull_diagnostics: Arc<AtomicBool>,
+    /// Debounces diagnostics runs per URI
+    diagnostics_debouncer: Arc<Debouncer>,
+    /// Symbols of the last workspace build, reused across `workspace/symbol`
+    /// queries until a file changes on disk
+    workspace_symbols: Arc<RwLock<Option<Arc<symbols::SymbolIndex>>>>,
+    /// URIs of the documents the client has open
+    open_documents: Arc<RwLock<HashSet<String>>>,
+    /// Opened and saved documents waiting for the diagnostics worker, with their
+    /// content, its hash and their version. The hash is taken once by the
+    /// notification handler and keys every cache the worker checks
+    diagnostics_queue: mpsc::UnboundedSender<(Url, String, String, Option<i32>)>,
+}
+
+/// A cached forge build output, along with the node index goto, references and
+/// rename look symbols up in. The index is built on first use and then reused by
+/// every request answered from the same build
+struct CachedAst {
+    data: serde_json::Value,
+    index: OnceLock<Option<goto::AstIndex>>,
+    /// Outline of the document the build was fetched for, extracted on the first
+    /// `textDocument/documentSymbol` request
+    document_symbols: OnceLock<Vec<DocumentSymbol>>,
+    /// Declarations already resolved for cursors in that document, keyed by
+    /// `(line, character)`. Editors repeat definition and declaration requests for
+    /// the same cursor, and each resolution reads the target file
+    declarations: std::sync::Mutex<HashMap<(u32, u32), Option<Location>>>,
+}
+
+impl CachedAst {
+    fn new(data: serde_json::Value) -> Self {
+        Self {
+            data,
+            index: OnceLock::new(),
+            document_symbols: OnceLock::new(),
+            declarations: std::sync::Mutex::default(),
+        }
+    }
+
+    fn index(&self) -> Option<&goto::AstIndex> {
+        self.index
+            .get_or_init(|| goto::AstIndex::new(&self.data))
+            .as_ref()
+    }
+
+    /// [`goto::goto_declaration_in`] for a cursor in `uri`, the document at `file_path`
+    /// this build was fetched for, answered from earlier requests for the same cursor
+    /// when possible
+    fn declaration(
+        &self,
+        uri: &Url,
+        file_path: &Path,
+        position: Position,
+        byte_position: usize,
+    ) -> Option<Location> {
+        let key = (position.line, position.character);
+        if let Ok(declarations) = self.declarations.lock()
+            && let Some(location) = declarations.get(&key)
+        {
+            return location.clone();
+        }
+
+        let location = self.index().and_then(|index| {
+            goto::goto_declaration_in(index, uri, file_path, position, byte_position)
+        });
+        if let Ok(mut declarations) = self.declarations.lock() {
+            declarations.insert(key, location.clone());
+        }
+        location
+    }
+
+    /// Whether the build compiled the file at `path`, as its target or one of its
+    /// imports. Builds without a source list are assumed to depend on it
+    fn depends_on(&self, path: &Path) -> bool {
+        match self
+            .data
+            .get("sources")
+            .and_then(|sources| sources.as_object())
+        {
+            Some(sources) => sources.keys().any(|source| path.ends_with(source)),
+            None => true,
+        }
+    }
+
+    /// Symbols of `file_path`, the document this build was fetched for
+    fn document_symbols(&self, file_path: &str) -> &[DocumentSymbol] {
+        self.document_symbols
+            .get_or_init(|| symbols::extract_document_symbols(&self.data, file_path))
+    }
 }
 
-#[allow(dead_code)]
 #[derive(Debug, Clone)]
 struct TextDocumentItem<'a> {
     uri: Url,
     text: &'a str,
+    /// [`utils::content_hash`] of `text`
+    content_hash: String,
     version: Option<i32>,
 }
 
@@ -43,60 +201,98 @@ impl ForgeLsp {
     pub fn new(client: Client) -> Self {
         let compiler = Arc::new(ForgeRunner) as Arc<dyn Runner>;
         let ast_cache = Arc::new(RwLock::new(HashMap::new()));
-        Self {
+        let ast_fetch = Arc::new(Mutex::new(HashMap::new()));
+        let forge_runs = Arc::new(Semaphore::new(MAX_CONCURRENT_FORGE_RUNS));
+        let workspace_root = Arc::new(OnceLock::new());
+        let diagnostics_cache = Arc::new(RwLock::new(HashMap::new()));
+        let published_diagnostics = Arc::new(RwLock::new(HashMap::new()));
+        let pull_diagnostics = Arc::new(AtomicBool::new(false));
+        let diagnostics_debouncer = Arc::new(Debouncer::new(
+            DIAGNOSTICS_DEBOUNCE_DELAY,
+            DIAGNOSTICS_MAX_WAIT,
+        ));
+        let workspace_symbols = Arc::new(RwLock::new(None));
+        let open_documents = Arc::new(RwLock::new(HashSet::new()));
+        let (diagnostics_queue, diagnostics_receiver) = mpsc::unbounded_channel();
+        let server = Self {
             client,
             compiler,
             ast_cache,
-        }
+            ast_fetch,
+            forge_runs,
+            workspace_root,
+            diagnostics_cache,
+            published_diagnostics,
+            pull_diagnostics,
+            diagnostics_debouncer,
+            workspace_symbols,
+            open_documents,
+            diagnostics_queue,
+        };
+        tokio::spawn(server.clone().diagnostics_worker(diagnostics_receiver));
+        server
     }
 
-    async fn on_change<'a>(&self, params: TextDocumentItem<'a>) {
-        let uri = params.uri.clone();
-        let version = params.version;
-
-        // Get file path for AST caching
-        let file_path = match uri.to_file_path() {
-            Ok(path) => path,
-            Err(_) => {
-                self.client
-                    .log_message(MessageType::ERROR, "Invalid file URI for AST caching")
-                    .await;
-                return;
+    /// Refresh diagnostics of opened and saved documents one batch at a time. The
+    /// documents of a batch are built concurrently, each by its own forge process,
+    /// up to [`MAX_CONCURRENT_FORGE_RUNS`] at a time. The next batch only starts once
+    /// all of them finish. Everything queued while a batch runs is drained into the
+    /// next one, keeping only the latest content per URI
+    async fn diagnostics_worker(
+        self,
+        mut receiver: mpsc::UnboundedReceiver<(Url, String, String, Option<i32>)>,
+    ) {
+        while let Some((uri, text, content_hash, version)) = receiver.recv().await {
+            let mut batch = HashMap::from([(uri, (text, content_hash, version))]);
+            while let Ok((uri, text, content_hash, version)) = receiver.try_recv() {
+                batch.insert(uri, (text, content_hash, version));
             }
-        };
 
-        let path_str = match file_path.to_str() {
-            Some(s) => s,
-            None => {
-                self.client
-                    .log_message(MessageType::ERROR, "Invalid file path for AST caching")
-                    .await;
-                return;
+            // Every document is built by its own forge process, so run the batch
+            // concurrently instead of one build after another. The open documents
+            // are read under one lock for the whole batch
+            let mut runs = JoinSet::new();
+            let open_documents = self.open_documents.read().await;
+            for (uri, (text, content_hash, version)) in batch {
+                // Documents closed while queued would only refill the caches
+                if !open_documents.contains(uri.as_str()) {
+                    continue;
+                }
+                let server = self.clone();
+                runs.spawn(async move {
+                    let Ok(_permit) = server.forge_runs.acquire().await else {
+                        return;
+                    };
+                    server
+                        .on_change(TextDocumentItem {
+                            uri,
+                            text: &text,
+                            content_hash,
+                            version,
+                        })
+                        .await;
+                });
             }
-        };
+            // Release the lock before the runs need it
+            drop(open_documents);
+            runs.join_all().await;
+            _ = self.client.semantic_tokens_refresh().await;
+        }
+    }
 
-        let (lint_result, build_result, ast_result) = tokio::join!(
-            self.compiler.get_lint_diagnostics(&uri),
-            self.compiler.get_build_diagnostics(&uri),
-            self.compiler.ast(path_str)
+    /// Run `forge lint` and `forge build` for a file and collect their diagnostics,
+    /// along with the build output so its AST doesn't need a second build.
+    /// `content` is the document text the caller already holds
+    async fn collect_diagnostics(
+        &self,
+        uri: &Url,
+        content: &str,
+    ) -> (Vec<Diagnostic>, Option<serde_json::Value>) {
+        let (lint_result, build_result) = tokio::join!(
+            self.compiler.get_lint_diagnostics(uri),
+            self.compiler.get_build_diagnostics_and_ast(uri, content)
         );
 
-        // Cache the AST data
-        if let Ok(ast_data) = ast_result {
-            let mut cache = self.ast_cache.write().await;
-            cache.insert(uri.to_string(), ast_data);
-            self.client
-                .log_message(MessageType::INFO, "AST data cached successfully")
-                .await;
-        } else if let Err(e) = ast_result {
-            self.client
-                .log_message(
-                    MessageType::WARNING,
-                    format!("Failed to cache AST data: {e}"),
-                )
-                .await;
-        }
-
         let mut all_diagnostics = vec![];
 
         match lint_result {
@@ -119,8 +315,8 @@ impl ForgeLsp {
             }
         }
 
-        match build_result {
-            Ok(mut builds) => {
+        let ast_data = match build_result {
+            Ok((mut builds, ast_data)) => {
                 self.client
                     .log_message(
                         MessageType::INFO,
@@ -128,6 +324,7 @@ impl ForgeLsp {
                     )
                     .await;
                 all_diagnostics.append(&mut builds);
+                Some(ast_data)
             }
             Err(e) => {
                 self.client
@@ -136,31 +333,356 @@ impl ForgeLsp {
                         format!("Forge build diagnostics failed: {e}"),
                     )
                     .await;
+                None
             }
+        };
+
+        (all_diagnostics, ast_data)
+    }
+
+    /// Diagnostics cached for `uri` if they were computed for the content identified
+    /// by `result_id`
+    async fn cached_diagnostics(&self, uri: &Url, result_id: &str) -> Option<Arc<Vec<Diagnostic>>> {
+        let cache = self.diagnostics_cache.read().await;
+        cache
+            .get(uri.as_str())
+            .filter(|(cached_id, _)| cached_id == result_id)
+            .map(|(_, diagnostics)| diagnostics.clone())
+    }
+
+    /// Collect diagnostics for `uri` and cache them under `result_id`, caching the
+    /// AST of the same build as well
+    async fn compile_diagnostics(
+        &self,
+        uri: &Url,
+        content: &str,
+        result_id: String,
+    ) -> Arc<Vec<Diagnostic>> {
+        let (diagnostics, ast_data) = self.collect_diagnostics(uri, content).await;
+        if let Some(ast_data) = ast_data {
+            self.cache_ast(uri, result_id.clone(), ast_data).await;
         }
 
+        let diagnostics = Arc::new(diagnostics);
+        self.diagnostics_cache
+            .write()
+            .await
+            .insert(uri.to_string(), (result_id, diagnostics.clone()));
+        diagnostics
+    }
+
+    /// Store the AST used by goto, references and rename for `uri`, built from the
+    /// content identified by `content_hash`
+    async fn cache_ast(&self, uri: &Url, content_hash: String, ast_data: serde_json::Value) {
+        self.ast_cache.write().await.insert(
+            uri.to_string(),
+            (content_hash, Arc::new(CachedAst::new(ast_data))),
+        );
         self.client
-            .publish_diagnostics(uri, all_diagnostics, version)
+            .log_message(MessageType::INFO, "AST data cached successfully")
             .await;
     }
 
+    /// AST cached for `uri` if it was built from the content identified by
+    /// `content_hash`
+    async fn current_ast(&self, uri: &Url, content_hash: &str) -> Option<Arc<CachedAst>> {
+        let cache = self.ast_cache.read().await;
+        cache
+            .get(uri.as_str())
+            .filter(|(cached_hash, _)| cached_hash == content_hash)
+            .map(|(_, cached_ast)| cached_ast.clone())
+    }
+
+    /// AST of `uri` from the cache, building and caching it on a miss. `source` is
+    /// the content of `file_path` the request read
+    async fn get_or_fetch_ast(
+        &self,
+        uri: &Url,
+        file_path: &Path,
+        source: &[u8],
+    ) -> Option<Arc<CachedAst>> {
+        // forge compiles the file on disk, so that content is what the AST reflects.
+        // Requests convert cursors against the same content, so an entry built from
+        // an earlier save would resolve them against stale spans until the debounced
+        // diagnostics run replaces it
+        let content_hash = utils::content_hash(std::str::from_utf8(source).ok()?);
+        if let Some(cached_ast) = self.current_ast(uri, &content_hash).await {
+            debug!("Using cached AST data");
+            return Some(cached_ast);
+        }
+
+        // Another request may have fetched it while this one waited for the lock
+        let fetch_lock = self
+            .ast_fetch
+            .lock()
+            .await
+            .entry(uri.to_string())
+            .or_default()
+            .clone();
+        let _fetching = fetch_lock.lock().await;
+        if let Some(cached_ast) = self.current_ast(uri, &content_hash).await {
+            debug!("Using AST fetched by a concurrent request");
+            return Some(cached_ast);
+        }
+
+        let Some(path_str) = file_path.to_str() else {
+            self.client
+                .log_message(MessageType::ERROR, "Invalid file path")
+                .await;
+            return None;
+        };
+
+        // Requests share the forge permits with the diagnostics worker
+        let Ok(_permit) = self.forge_runs.acquire().await else {
+            return None;
+        };
+        match self.compiler.ast(path_str).await {
+            Ok(data) => {
+                self.client
+                    .log_message(MessageType::INFO, "Fetched and caching new AST data")
+                    .await;
+
+                let data = Arc::new(CachedAst::new(data));
+                self.ast_cache
+                    .write()
+                    .await
+                    .insert(uri.to_string(), (content_hash, data.clone()));
+                Some(data)
+            }
+            Err(e) => {
+                self.client
+                    .log_message(MessageType::ERROR, format!("Failed to get AST: {e}"))
+                    .await;
+                None
+            }
+        }
+    }
+
+    /// Run forge for the AST of `uri` alone and cache it, unless the cached AST was
+    /// already built from the content identified by `content_hash`
+    async fn refresh_ast(&self, uri: &Url, content_hash: String) {
+        let current = matches!(
+            self.ast_cache.read().await.get(uri.as_str()),
+            Some((cached_hash, _)) if *cached_hash == content_hash
+        );
+        if current {
+            debug!(%uri, "AST is up to date");
+            return;
+        }
+
+        // Get file path for AST caching
+        let file_path = match uri.to_file_path() {
+            Ok(path) => path,
+            Err(_) => {
+                self.client
+                    .log_message(MessageType::ERROR, "Invalid file URI for AST caching")
+                    .await;
+                return;
+            }
+        };
+
+        let path_str = match file_path.to_str() {
+            Some(s) => s,
+            None => {
+                self.client
+                    .log_message(MessageType::ERROR, "Invalid file path for AST caching")
+                    .await;
+                return;
+            }
+        };
+
+        match self.compiler.ast(path_str).await {
+            Ok(ast_data) => self.cache_ast(uri, content_hash, ast_data).await,
+            Err(e) => {
+                self.client
+                    .log_message(
+                        MessageType::WARNING,
+                        format!("Failed to cache AST data: {e}"),
+                    )
+                    .await;
+            }
+        }
+    }
+
+    /// Refresh diagnostics of `uri` once a burst of saves ends. The file is read at
+    /// that point, so the run always sees the content of the last save rather than
+    /// the one that started the burst
+    async fn on_save(&self, uri: Url) {
+        // Only the last save of a burst runs diagnostics
+        if !self.diagnostics_debouncer.trigger(uri.as_str()).await {
+            return;
+        }
+
+        // `Url::path` is still percent-encoded, so decode it into a file path
+        let Ok(path) = uri.to_file_path() else {
+            self.client
+                .log_message(MessageType::ERROR, "Invalid file URI on save")
+                .await;
+            return;
+        };
+        let text_content = match tokio::fs::read_to_string(&path).await {
+            Ok(content) => content,
+            Err(e) => {
+                self.client
+                    .log_message(
+                        MessageType::ERROR,
+                        format!("Failed to read file on save: {e}"),
+                    )
+                    .await;
+                return;
+            }
+        };
+
+        // Diagnostics of other files may depend on the saved one, so drop every
+        // cached report unless the save left the file content unchanged. Workspace
+        // symbols are rebuilt on the next query for the same reason
+        let result_id = utils::content_hash(&text_content);
+        if self.cached_diagnostics(&uri, &result_id).await.is_none() {
+            self.diagnostics_cache.write().await.clear();
+            *self.workspace_symbols.write().await = None;
+        }
+
+        // The same goes for ASTs: the saved file's own entry when it was built from
+        // other content, and those of other files whose build compiled the saved
+        // file, directly or through an import. The rest stay valid
+        {
+            let mut asts = self.ast_cache.write().await;
+            let unchanged = matches!(
+                asts.get(uri.as_str()),
+                Some((cached_hash, _)) if *cached_hash == result_id
+            );
+            if !unchanged {
+                asts.retain(|cached_uri, (_, ast)| {
+                    cached_uri != uri.as_str() && !ast.depends_on(&path)
+                });
+            }
+        }
+
+        // Always run diagnostics on save to reflect the current file state
+        _ = self
+            .diagnostics_queue
+            .send((uri, text_content, result_id, None));
+    }
+
+    async fn on_change<'a>(&self, params: TextDocumentItem<'a>) {
+        let TextDocumentItem {
+            uri,
+            text,
+            content_hash: result_id,
+            version,
+        } = params;
+
+        // Clients that pull diagnostics request them on their own schedule, so
+        // only refresh the AST here. Content that was already compiled reuses its
+        // diagnostics instead of running forge again
+        let pull_diagnostics = self.pull_diagnostics.load(Ordering::Relaxed);
+        let mut compiled = false;
+        let diagnostics = if pull_diagnostics {
+            None
+        } else {
+            match self.cached_diagnostics(&uri, &result_id).await {
+                Some(diagnostics) => Some(diagnostics),
+                None => {
+                    compiled = true;
+                    Some(
+                        self.compile_diagnostics(&uri, text, result_id.clone())
+                            .await,
+                    )
+                }
+            }
+        };
+
+        // A fresh compile already cached the AST from its own build output, so only
+        // run forge for the AST when diagnostics didn't
+        if !compiled {
+            self.refresh_ast(&uri, result_id).await;
+        }
+
+        if let Some(diagnostics) = diagnostics {
+            // Skip notifications that would repeat what the client already shows
+            {
+                let mut published = self.published_diagnostics.write().await;
+                if published.get(uri.as_str()) == Some(&diagnostics) {
+                    return;
+                }
+                published.insert(uri.to_string(), diagnostics.clone());
+            }
+            self.client
+                .publish_diagnostics(uri, Arc::unwrap_or_clone(diagnostics), version)
+                .await;
+        }
+    }
+
+    /// Symbols of the whole workspace, building it only when no earlier query
+    /// left an index behind
+    async fn workspace_symbol_index(&self) -> Option<Arc<symbols::SymbolIndex>> {
+        if let Some(index) = self.workspace_symbols.read().await.clone() {
+            return Some(index);
+        }
+
+        // Workspace symbols need the AST of every file, so build the workspace root,
+        // or the current directory if the client didn't report one
+        let root = self
+            .workspace_root
+            .get()
+            .cloned()
+            .or_else(|| std::env::current_dir().ok());
+        let ast_data = if let Some(dir) = root {
+            let path_str = dir.to_str().unwrap_or(".");
+            let Ok(_permit) = self.forge_runs.acquire().await else {
+                return None;
+            };
+            match self.compiler.ast(path_str).await {
+                Ok(data) => data,
+                Err(e) => {
+                    self.client
+                        .log_message(
+                            MessageType::WARNING,
+                            format!("Failed to get AST data for workspace symbols: {e}"),
+                        )
+                        .await;
+                    return None;
+                }
+            }
+        } else {
+            self.client
+                .log_message(MessageType::ERROR, "Could not determine workspace root")
+                .await;
+            return None;
+        };
+
+        let index =
+            run_blocking(move || symbols::SymbolIndex::new(symbols::extract_symbols(&ast_data)))
+                .await?;
+        let index = Arc::new(index);
+        *self.workspace_symbols.write().await = Some(index.clone());
+        Some(index)
+    }
+
     async fn apply_workspace_edit(&self, workspace_edit: &WorkspaceEdit) -> Result<(), String> {
         if let Some(changes) = &workspace_edit.changes {
             for (uri, edits) in changes {
                 let path = uri.to_file_path().map_err(|_| "Invalid URI".to_string())?;
-                let mut content = std::fs::read_to_string(&path).map_err(|e| e.to_string())?;
+                let mut content = tokio::fs::read_to_string(&path)
+                    .await
+                    .map_err(|e| e.to_string())?;
 
-                // Sort edits by start position descending to avoid offset issues
+                // Sort edits by start position descending to avoid offset issues. Each
+                // edit then only touches text after the ones still to be applied, so
+                // offsets from the original line index stay valid
                 let mut sorted_edits = edits.clone();
                 sorted_edits.sort_by(|a, b| b.range.start.cmp(&a.range.start));
+                let lines = LineIndex::new(&content);
 
                 for edit in sorted_edits {
-                    let start_byte = byte_offset(&content, edit.range.start)?;
-                    let end_byte = byte_offset(&content, edit.range.end)?;
+                    let start_byte = byte_offset(&lines, edit.range.start)?;
+                    let end_byte = byte_offset(&lines, edit.range.end)?;
                     content.replace_range(start_byte..end_byte, &edit.new_text);
                 }
 
-                std::fs::write(&path, &content).map_err(|e| e.to_string())?;
+                tokio::fs::write(&path, &content)
+                    .await
+                    .map_err(|e| e.to_string())?;
             }
         }
         Ok(())
@@ -171,25 +693,34 @@ impl ForgeLsp {
 impl LanguageServer for ForgeLsp {
     async fn initialize(
         &self,
-        _: InitializeParams,
+        params: InitializeParams,
     ) -> tower_lsp::jsonrpc::Result<InitializeResult> {
+        let supports_pull_diagnostics = params
+            .capabilities
+            .text_document
+            .as_ref()
+            .and_then(|text_document| text_document.diagnostic.as_ref())
+            .is_some();
+        self.pull_diagnostics
+            .store(supports_pull_diagnostics, Ordering::Relaxed);
+
+        // Resolve the root once so later requests don't depend on the process cwd
+        let root_uri = params
+            .workspace_folders
+            .as_ref()
+            .and_then(|folders| folders.first())
+            .map(|folder| &folder.uri)
+            .or(params.root_uri.as_ref());
+        if let Some(root) = root_uri.and_then(|uri| uri.to_file_path().ok()) {
+            _ = self.workspace_root.set(root.canonicalize().unwrap_or(root));
+        }
+
         Ok(InitializeResult {
             server_info: Some(ServerInfo {
-                name: "forge lsp".to_string(),
-                version: Some("0.0.1".to_string()),
+                name: SERVER_NAME.to_string(),
+                version: Some(SERVER_VERSION.to_string()),
             }),
-            capabilities: ServerCapabilities {
-                definition_provider: Some(OneOf::Left(true)),
-                declaration_provider: Some(DeclarationCapability::Simple(true)),
-                references_provider: Some(OneOf::Left(true)),
-                rename_provider: Some(OneOf::Left(true)),
-                workspace_symbol_provider: Some(OneOf::Left(true)),
-                document_symbol_provider: Some(OneOf::Left(true)),
-                text_document_sync: Some(TextDocumentSyncCapability::Kind(
-                    TextDocumentSyncKind::FULL,
-                )),
-                ..ServerCapabilities::default()
-            },
+            capabilities: server_capabilities(),
         })
     }
 
@@ -211,30 +742,28 @@ impl LanguageServer for ForgeLsp {
             .log_message(MessageType::INFO, "file opened")
             .await;
 
-        self.on_change(TextDocumentItem {
-            uri: params.text_document.uri,
-            text: &params.text_document.text,
-            version: Some(params.text_document.version),
-        })
-        .await
+        let content_hash = utils::content_hash(&params.text_document.text);
+        self.open_documents
+            .write()
+            .await
+            .insert(params.text_document.uri.to_string());
+
+        // Hand the compile to the diagnostics worker instead of holding the
+        // notification handler until forge finishes
+        _ = self.diagnostics_queue.send((
+            params.text_document.uri,
+            params.text_document.text,
+            content_hash,
+            Some(params.text_document.version),
+        ));
     }
 
     async fn did_change(&self, params: DidChangeTextDocumentParams) {
-        self.client
-            .log_message(MessageType::INFO, "file changed")
-            .await;
-
-        // Invalidate cached AST data for the changed file
-        let uri = params.text_document.uri;
-        let mut cache = self.ast_cache.write().await;
-        if cache.remove(&uri.to_string()).is_some() {
-            self.client
-                .log_message(
-                    MessageType::INFO,
-                    "Invalidated cached AST data for changed file",
-                )
-                .await;
-        }
+        // This runs on every keystroke, so log through tracing rather than sending
+        // a window/logMessage notification to the client each time. Nothing is
+        // compiled or hashed here: forge compiles the saved file, so the cached AST
+        // only goes stale once a save changes the content
+        debug!(uri = %params.text_document.uri, "file changed");
     }
 
     async fn did_save(&self, params: DidSaveTextDocumentParams) {
@@ -242,38 +771,23 @@ impl LanguageServer for ForgeLsp {
             .log_message(MessageType::INFO, "file saved - running diagnostics")
             .await;
 
-        // Run diagnostics on save, regardless of whether text is provided
-        // If text is provided, use it; otherwise read from file system
-        let text_content = if let Some(text) = params.text {
-            text
-        } else {
-            // Read the file from disk since many LSP clients don't send text on save
-            match std::fs::read_to_string(params.text_document.uri.path()) {
-                Ok(content) => content,
-                Err(e) => {
-                    self.client
-                        .log_message(
-                            MessageType::ERROR,
-                            format!("Failed to read file on save: {e}"),
-                        )
-                        .await;
-                    return;
-                }
-            }
-        };
-
-        let item = TextDocumentItem {
-            uri: params.text_document.uri,
-            text: &text_content,
-            version: None,
-        };
-
-        // Always run diagnostics on save to reflect the current file state
-        self.on_change(item).await;
-        _ = self.client.semantic_tokens_refresh().await;
+        // Waiting out the debounce here would hold the notification handler, and
+        // every notification queued behind it, for up to the max wait
+        let server = self.clone();
+        tokio::spawn(async move { server.on_save(params.text_document.uri).await });
     }
 
-    async fn did_close(&self, _: DidCloseTextDocumentParams) {
+    async fn did_close(&self, params: DidCloseTextDocumentParams) {
+        // Per-document state only lives while the document is open, which keeps
+        // the caches bounded by the number of open files over long sessions
+        let uri = params.text_document.uri.as_str();
+        self.diagnostics_debouncer.cancel(uri).await;
+        self.open_documents.write().await.remove(uri);
+        self.ast_fetch.lock().await.remove(uri);
+        self.ast_cache.write().await.remove(uri);
+        self.diagnostics_cache.write().await.remove(uri);
+        self.published_diagnostics.write().await.remove(uri);
+
         self.client
             .log_message(MessageType::INFO, "file closed")
             .await;
@@ -292,11 +806,71 @@ impl LanguageServer for ForgeLsp {
     }
 
     async fn did_change_watched_files(&self, _: DidChangeWatchedFilesParams) {
+        *self.workspace_symbols.write().await = None;
         self.client
             .log_message(MessageType::INFO, "watched files have changed!")
             .await;
     }
 
+    async fn diagnostic(
+        &self,
+        params: DocumentDiagnosticParams,
+    ) -> tower_lsp::jsonrpc::Result<DocumentDiagnosticReportResult> {
+        let uri = params.text_document.uri;
+
+        // forge diagnoses the file on disk, so its content identifies the report
+        let content = match uri.to_file_path() {
+            Ok(path) => tokio::fs::read_to_string(&path).await.ok(),
+            Err(_) => None,
+        };
+        let Some(content) = content else {
+            self.client
+                .log_message(MessageType::ERROR, "Failed to read file for diagnostics")
+                .await;
+            return Ok(DocumentDiagnosticReportResult::Report(
+                DocumentDiagnosticReport::Full(RelatedFullDocumentDiagnosticReport {
+                    related_documents: None,
+                    full_document_diagnostic_report: FullDocumentDiagnosticReport {
+                        result_id: None,
+                        items: vec![],
+                    },
+                }),
+            ));
+        };
+        let result_id = utils::content_hash(&content);
+
+        let cached = self.cached_diagnostics(&uri, &result_id).await;
+
+        if cached.is_some() && params.previous_result_id.as_deref() == Some(result_id.as_str()) {
+            return Ok(DocumentDiagnosticReportResult::Report(
+                DocumentDiagnosticReport::Unchanged(RelatedUnchangedDocumentDiagnosticReport {
+                    related_documents: None,
+                    unchanged_document_diagnostic_report: UnchangedDocumentDiagnosticReport {
+                        result_id,
+                    },
+                }),
+            ));
+        }
+
+        let diagnostics = match cached {
+            Some(diagnostics) => diagnostics,
+            None => {
+                self.compile_diagnostics(&uri, &content, result_id.clone())
+                    .await
+            }
+        };
+
+        Ok(DocumentDiagnosticReportResult::Report(
+            DocumentDiagnosticReport::Full(RelatedFullDocumentDiagnosticReport {
+                related_documents: None,
+                full_document_diagnostic_report: FullDocumentDiagnosticReport {
+                    result_id: Some(result_id),
+                    items: Arc::unwrap_or_clone(diagnostics),
+                },
+            }),
+        ))
+    }
+
     async fn goto_definition(
         &self,
         params: GotoDefinitionParams,
@@ -320,7 +894,7 @@ impl LanguageServer for ForgeLsp {
         };
 
         // Read the source file
-        let source_bytes = match std::fs::read(&file_path) {
+        let source_bytes = match tokio::fs::read(&file_path).await {
             Ok(bytes) => bytes,
             Err(e) => {
                 self.client
@@ -330,51 +904,31 @@ impl LanguageServer for ForgeLsp {
             }
         };
 
-        // Try to get AST data from cache first
-        let ast_data = {
-            let cache = self.ast_cache.read().await;
-            if let Some(cached_ast) = cache.get(&uri.to_string()) {
-                self.client
-                    .log_message(MessageType::INFO, "Using cached AST data")
-                    .await;
-                cached_ast.clone()
-            } else {
-                // Cache miss - get AST data and cache it
-                drop(cache); // Release read lock
-
-                let path_str = match file_path.to_str() {
-                    Some(s) => s,
-                    None => {
-                        self.client
-                            .log_message(MessageType::ERROR, "Invalid file path")
-                            .await;
-                        return Ok(None);
-                    }
-                };
-
-                match self.compiler.ast(path_str).await {
-                    Ok(data) => {
-                        self.client
-                            .log_message(MessageType::INFO, "Fetched and caching new AST data")
-                            .await;
+        // Comments, strings and whitespace never resolve to a declaration, so
+        // answer without fetching the AST, which may mean running forge
+        let byte_position = goto::pos_to_bytes(&source_bytes, position);
+        if !utils::may_reference_symbol(&source_bytes, byte_position) {
+            return Ok(Some(GotoDefinitionResponse::from(Location {
+                uri,
+                range: Range {
+                    start: position,
+                    end: position,
+                },
+            })));
+        }
 
-                        // Cache the new AST data
-                        let mut cache = self.ast_cache.write().await;
-                        cache.insert(uri.to_string(), data.clone());
-                        data
-                    }
-                    Err(e) => {
-                        self.client
-                            .log_message(MessageType::ERROR, format!("Failed to get AST: {e}"))
-                            .await;
-                        return Ok(None);
-                    }
-                }
-            }
+        let Some(ast) = self.get_or_fetch_ast(&uri, &file_path, &source_bytes).await else {
+            return Ok(None);
         };
 
         // Use goto_declaration function (same logic for both definition and declaration)
-        if let Some(location) = goto::goto_declaration(&ast_data, &uri, position, &source_bytes) {
+        let location = run_blocking({
+            let uri = uri.clone();
+            move || ast.declaration(&uri, &file_path, position, byte_position)
+        })
+        .await
+        .flatten();
+        if let Some(location) = location {
             self.client
                 .log_message(
                     MessageType::INFO,
@@ -424,7 +978,7 @@ impl LanguageServer for ForgeLsp {
         };
 
         // Read the source file
-        let source_bytes = match std::fs::read(&file_path) {
+        let source_bytes = match tokio::fs::read(&file_path).await {
             Ok(bytes) => bytes,
             Err(e) => {
                 self.client
@@ -434,51 +988,31 @@ impl LanguageServer for ForgeLsp {
             }
         };
 
-        // Try to get AST data from cache first
-        let ast_data = {
-            let cache = self.ast_cache.read().await;
-            if let Some(cached_ast) = cache.get(&uri.to_string()) {
-                self.client
-                    .log_message(MessageType::INFO, "Using cached AST data")
-                    .await;
-                cached_ast.clone()
-            } else {
-                // Cache miss - get AST data and cache it
-                drop(cache); // Release read lock
-
-                let path_str = match file_path.to_str() {
-                    Some(s) => s,
-                    None => {
-                        self.client
-                            .log_message(MessageType::ERROR, "Invalid file path")
-                            .await;
-                        return Ok(None);
-                    }
-                };
-
-                match self.compiler.ast(path_str).await {
-                    Ok(data) => {
-                        self.client
-                            .log_message(MessageType::INFO, "Fetched and caching new AST data")
-                            .await;
+        // Comments, strings and whitespace never resolve to a declaration, so
+        // answer without fetching the AST, which may mean running forge
+        let byte_position = goto::pos_to_bytes(&source_bytes, position);
+        if !utils::may_reference_symbol(&source_bytes, byte_position) {
+            return Ok(Some(request::GotoDeclarationResponse::from(Location {
+                uri,
+                range: Range {
+                    start: position,
+                    end: position,
+                },
+            })));
+        }
 
-                        // Cache the new AST data
-                        let mut cache = self.ast_cache.write().await;
-                        cache.insert(uri.to_string(), data.clone());
-                        data
-                    }
-                    Err(e) => {
-                        self.client
-                            .log_message(MessageType::ERROR, format!("Failed to get AST: {e}"))
-                            .await;
-                        return Ok(None);
-                    }
-                }
-            }
+        let Some(ast) = self.get_or_fetch_ast(&uri, &file_path, &source_bytes).await else {
+            return Ok(None);
         };
 
         // Use goto_declaration function
-        if let Some(location) = goto::goto_declaration(&ast_data, &uri, position, &source_bytes) {
+        let location = run_blocking({
+            let uri = uri.clone();
+            move || ast.declaration(&uri, &file_path, position, byte_position)
+        })
+        .await
+        .flatten();
+        if let Some(location) = location {
             self.client
                 .log_message(
                     MessageType::INFO,
@@ -528,7 +1062,7 @@ impl LanguageServer for ForgeLsp {
         };
 
         // Read the source file
-        let source_bytes = match std::fs::read(&file_path) {
+        let source_bytes = match tokio::fs::read(&file_path).await {
             Ok(bytes) => bytes,
             Err(e) => {
                 self.client
@@ -538,51 +1072,25 @@ impl LanguageServer for ForgeLsp {
             }
         };
 
-        // Try to get AST data from cache first
-        let ast_data = {
-            let cache = self.ast_cache.read().await;
-            if let Some(cached_ast) = cache.get(&uri.to_string()) {
-                self.client
-                    .log_message(MessageType::INFO, "Using cached AST data")
-                    .await;
-                cached_ast.clone()
-            } else {
-                // Cache miss - get AST data and cache it
-                drop(cache); // Release read lock
-
-                let path_str = match file_path.to_str() {
-                    Some(s) => s,
-                    None => {
-                        self.client
-                            .log_message(MessageType::ERROR, "Invalid file path")
-                            .await;
-                        return Ok(None);
-                    }
-                };
-
-                match self.compiler.ast(path_str).await {
-                    Ok(data) => {
-                        self.client
-                            .log_message(MessageType::INFO, "Fetched and caching new AST data")
-                            .await;
+        // Comments, strings and whitespace have no references, so answer without
+        // fetching the AST, which may mean running forge
+        let byte_position = goto::pos_to_bytes(&source_bytes, position);
+        if !utils::may_reference_symbol(&source_bytes, byte_position) {
+            return Ok(None);
+        }
 
-                        // Cache the new AST data
-                        let mut cache = self.ast_cache.write().await;
-                        cache.insert(uri.to_string(), data.clone());
-                        data
-                    }
-                    Err(e) => {
-                        self.client
-                            .log_message(MessageType::ERROR, format!("Failed to get AST: {e}"))
-                            .await;
-                        return Ok(None);
-                    }
-                }
-            }
+        let Some(ast) = self.get_or_fetch_ast(&uri, &file_path, &source_bytes).await else {
+            return Ok(None);
         };
 
         // Use goto_references function to find all references
-        let locations = references::goto_references(&ast_data, &uri, position, &source_bytes);
+        let locations = run_blocking(move || {
+            ast.index()
+                .map(|index| references::goto_references_in(index, &file_path, byte_position))
+        })
+        .await
+        .flatten()
+        .unwrap_or_default();
 
         if locations.is_empty() {
             self.client
@@ -624,7 +1132,7 @@ impl LanguageServer for ForgeLsp {
         };
 
         // Read the source file
-        let source_bytes = match std::fs::read(&file_path) {
+        let source_bytes = match tokio::fs::read(&file_path).await {
             Ok(bytes) => bytes,
             Err(e) => {
                 self.client
@@ -634,8 +1142,14 @@ impl LanguageServer for ForgeLsp {
             }
         };
 
-        // Get the current identifier at the position
-        let current_identifier = match rename::get_identifier_at_position(&source_bytes, position) {
+        // Get the current identifier at the position. Words in comments and strings
+        // are not symbols, so they are skipped before any AST is fetched
+        let byte_position = goto::pos_to_bytes(&source_bytes, position);
+        let identifier = match utils::is_in_comment_or_string(&source_bytes, byte_position) {
+            true => None,
+            false => rename::get_identifier_at_position(&source_bytes, position),
+        };
+        let current_identifier = match identifier {
             Some(id) => id,
             None => {
                 self.client
@@ -663,51 +1177,19 @@ impl LanguageServer for ForgeLsp {
             return Ok(None);
         }
 
-        // Try to get AST data from cache first
-        let ast_data = {
-            let cache = self.ast_cache.read().await;
-            if let Some(cached_ast) = cache.get(&uri.to_string()) {
-                self.client
-                    .log_message(MessageType::INFO, "Using cached AST data")
-                    .await;
-                cached_ast.clone()
-            } else {
-                // Cache miss - get AST data and cache it
-                drop(cache); // Release read lock
-
-                let path_str = match file_path.to_str() {
-                    Some(s) => s,
-                    None => {
-                        self.client
-                            .log_message(MessageType::ERROR, "Invalid file path")
-                            .await;
-                        return Ok(None);
-                    }
-                };
-
-                match self.compiler.ast(path_str).await {
-                    Ok(data) => {
-                        self.client
-                            .log_message(MessageType::INFO, "Fetched and caching new AST data")
-                            .await;
-
-                        // Cache the new AST data
-                        let mut cache = self.ast_cache.write().await;
-                        cache.insert(uri.to_string(), data.clone());
-                        data
-                    }
-                    Err(e) => {
-                        self.client
-                            .log_message(MessageType::ERROR, format!("Failed to get AST: {e}"))
-                            .await;
-                        return Ok(None);
-                    }
-                }
-            }
+        let Some(ast) = self.get_or_fetch_ast(&uri, &file_path, &source_bytes).await else {
+            return Ok(None);
         };
 
         // Use the rename_symbol function to handle the rename logic
-        match rename::rename_symbol(&ast_data, &uri, position, &source_bytes, new_name) {
+        let edit = run_blocking(move || {
+            ast.index().and_then(|index| {
+                rename::rename_symbol_in(index, &file_path, byte_position, new_name)
+            })
+        })
+        .await
+        .flatten();
+        match edit {
             Some(workspace_edit) => {
                 self.client
                     .log_message(
@@ -723,24 +1205,17 @@ impl LanguageServer for ForgeLsp {
                     )
                     .await;
 
-                // Separate changes: apply server-side for other files, return client-side for current file
-                let mut server_changes = HashMap::new();
-                let mut client_changes = HashMap::new();
-
-                if let Some(changes) = &workspace_edit.changes {
-                    for (file_uri, edits) in changes {
-                        if file_uri == &uri {
-                            client_changes.insert(file_uri.clone(), edits.clone());
-                        } else {
-                            server_changes.insert(file_uri.clone(), edits.clone());
-                        }
-                    }
-                }
+                // Separate changes: apply server-side for other files, return client-side for current file.
+                // The current file's edits are taken out with one lookup and every other
+                // file's edits are moved rather than cloned
+                let mut server_changes = workspace_edit.changes.unwrap_or_default();
+                let client_changes: HashMap<Url, Vec<TextEdit>> =
+                    server_changes.remove_entry(&uri).into_iter().collect();
 
                 // Apply edits for other files server-side
                 if !server_changes.is_empty() {
                     let server_edit = WorkspaceEdit {
-                        changes: Some(server_changes.clone()),
+                        changes: Some(server_changes),
                         ..Default::default()
                     };
                     if let Err(e) = self.apply_workspace_edit(&server_edit).await {
@@ -761,7 +1236,7 @@ impl LanguageServer for ForgeLsp {
 
                     // Invalidate AST cache for modified files
                     let mut cache = self.ast_cache.write().await;
-                    for uri in server_changes.keys() {
+                    for uri in server_edit.changes.iter().flat_map(HashMap::keys) {
                         cache.remove(uri.as_str());
                     }
                 }
@@ -794,45 +1269,10 @@ impl LanguageServer for ForgeLsp {
             .log_message(MessageType::INFO, "Got a workspace/symbol request")
             .await;
 
-        // Get AST data from cache or build it
-        // For workspace symbols, we need to get AST data for all files
-        // Since we don't have a specific file, we'll need to build all files
-
-        // For now, let's try to get AST data by building the current directory
-        // This is a simplified approach - in a full implementation, we'd want to
-        // cache AST data for all files in the workspace
-
-        let current_dir = std::env::current_dir().ok();
-        let ast_data = if let Some(dir) = current_dir {
-            let path_str = dir.to_str().unwrap_or(".");
-            match self.compiler.ast(path_str).await {
-                Ok(data) => data,
-                Err(e) => {
-                    self.client
-                        .log_message(
-                            MessageType::WARNING,
-                            format!("Failed to get AST data for workspace symbols: {e}"),
-                        )
-                        .await;
-                    return Ok(None);
-                }
-            }
-        } else {
-            self.client
-                .log_message(MessageType::ERROR, "Could not get current directory")
-                .await;
+        let Some(index) = self.workspace_symbol_index().await else {
             return Ok(None);
         };
-
-        let mut all_symbols = symbols::extract_symbols(&ast_data);
-
-        // Filter symbols based on query if provided
-        if !params.query.is_empty() {
-            let query = params.query.to_lowercase();
-            all_symbols.retain(|symbol| {
-                symbol.name.to_lowercase().contains(&query)
-            });
-        }
+        let all_symbols = index.search(&params.query);
 
         if all_symbols.is_empty() {
             self.client
@@ -881,21 +1321,29 @@ impl LanguageServer for ForgeLsp {
             }
         };
 
-        // Get AST data for this specific file
-        let ast_data = match self.compiler.ast(path_str).await {
-            Ok(data) => data,
+        // The file content identifies the build the outline can be taken from
+        let source_bytes = match tokio::fs::read(&file_path).await {
+            Ok(bytes) => bytes,
             Err(e) => {
                 self.client
-                    .log_message(
-                        MessageType::WARNING,
-                        format!("Failed to get AST data for document symbols: {e}"),
-                    )
+                    .log_message(MessageType::ERROR, format!("Failed to read file: {e}"))
                     .await;
                 return Ok(None);
             }
         };
 
-        let symbols = symbols::extract_document_symbols(&ast_data, path_str);
+        // Reuse the AST cached for this document, which stays valid until its
+        // content changes, instead of running forge for every outline refresh
+        let Some(ast) = self.get_or_fetch_ast(&uri, &file_path, &source_bytes).await else {
+            return Ok(None);
+        };
+
+        // Editors re-request the outline on every cursor move or edit, so the
+        // symbols are extracted once per build and cloned from there
+        let path_str = path_str.to_string();
+        let symbols = run_blocking(move || ast.document_symbols(&path_str).to_vec())
+            .await
+            .unwrap_or_default();
 
         if symbols.is_empty() {
             self.client
@@ -929,3 +1377,162 @@ impl LanguageServer for ForgeLsp {
         Ok(None)
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use crate::runner::RunnerError;
+    use serde_json::json;
+    use std::sync::atomic::AtomicUsize;
+    use tower_lsp::{LspService, async_trait};
+
+    /// Runner answering every AST request with the same output, counting them
+    struct MockRunner {
+        ast: serde_json::Value,
+        ast_calls: AtomicUsize,
+    }
+
+    impl MockRunner {
+        fn new(ast: serde_json::Value) -> Arc<Self> {
+            Arc::new(Self {
+                ast,
+                ast_calls: AtomicUsize::new(0),
+            })
+        }
+    }
+
+    #[async_trait]
+    impl Runner for MockRunner {
+        async fn build(&self, _: &str) -> Result<serde_json::Value, RunnerError> {
+            Err(RunnerError::EmptyOutput)
+        }
+
+        async fn lint(&self, _: &str) -> Result<serde_json::Value, RunnerError> {
+            Err(RunnerError::EmptyOutput)
+        }
+
+        async fn ast(&self, _: &str) -> Result<serde_json::Value, RunnerError> {
+            self.ast_calls.fetch_add(1, Ordering::SeqCst);
+            Ok(self.ast.clone())
+        }
+
+        async fn get_build_diagnostics(&self, _: &Url) -> Result<Vec<Diagnostic>, RunnerError> {
+            Ok(Vec::new())
+        }
+
+        async fn get_build_diagnostics_and_ast(
+            &self,
+            _: &Url,
+            _: &str,
+        ) -> Result<(Vec<Diagnostic>, serde_json::Value), RunnerError> {
+            Err(RunnerError::EmptyOutput)
+        }
+
+        async fn get_lint_diagnostics(&self, _: &Url) -> Result<Vec<Diagnostic>, RunnerError> {
+            Ok(Vec::new())
+        }
+    }
+
+    /// Server running `runner` instead of forge, with saves debounced only briefly
+    fn server(runner: Arc<dyn Runner>) -> ForgeLsp {
+        let (service, _) = LspService::new(ForgeLsp::new);
+        let mut server = service.inner().clone();
+        server.compiler = runner;
+        server.diagnostics_debouncer = Arc::new(Debouncer::new(
+            Duration::from_millis(1),
+            Duration::from_millis(1),
+        ));
+        server
+    }
+
+    const A: &str = "contract A {}";
+    const B: &str = "import \"./A.sol\"; contract B is A {}";
+    const C: &str = "contract C {}";
+
+    /// Write `src/A.sol`, `src/B.sol` importing it and an unrelated `src/C.sol`, and
+    /// cache an AST for each. A's build ran when its content was `built_a`
+    async fn workspace(server: &ForgeLsp, built_a: &str) -> (tempfile::TempDir, [Url; 3]) {
+        let dir = tempfile::tempdir().expect("failed to create temp dir");
+        std::fs::create_dir(dir.path().join("src")).unwrap();
+        let files = [
+            ("A.sol", A, built_a, json!({ "src/A.sol": {} })),
+            ("B.sol", B, B, json!({ "src/A.sol": {}, "src/B.sol": {} })),
+            ("C.sol", C, C, json!({ "src/C.sol": {} })),
+        ];
+        let mut uris = Vec::new();
+        for (name, content, built, sources) in files {
+            let path = dir.path().join("src").join(name);
+            std::fs::write(&path, content).unwrap();
+            let uri = Url::from_file_path(&path).unwrap();
+            let ast = json!({ "sources": sources });
+            let content_hash = utils::content_hash(built);
+            server.cache_ast(&uri, content_hash, ast).await;
+            uris.push(uri);
+        }
+        (dir, uris.try_into().unwrap())
+    }
+
+    async fn is_cached(server: &ForgeLsp, uri: &Url) -> bool {
+        server.ast_cache.read().await.contains_key(uri.as_str())
+    }
+
+    #[test]
+    fn test_depends_on() {
+        let ast = CachedAst::new(json!({ "sources": { "src/B.sol": {}, "src/A.sol": {} } }));
+        assert!(ast.depends_on(Path::new("/project/src/A.sol")));
+        assert!(!ast.depends_on(Path::new("/project/src/C.sol")));
+        assert!(!ast.depends_on(Path::new("/project/lib/src/C.sol")));
+
+        // Without a source list every file may be part of the build
+        let ast = CachedAst::new(json!({}));
+        assert!(ast.depends_on(Path::new("/project/src/C.sol")));
+    }
+
+    #[tokio::test]
+    async fn test_get_or_fetch_ast_rejects_entry_from_earlier_save() {
+        let runner = MockRunner::new(json!({ "build": "current" }));
+        let server = server(runner.clone());
+        let (dir, [uri, _, _]) = workspace(&server, "contract A { uint x; }").await;
+        let path = dir.path().join("src/A.sol");
+
+        let ast = server.get_or_fetch_ast(&uri, &path, A.as_bytes()).await;
+        assert_eq!(ast.unwrap().data["build"], "current");
+        assert_eq!(runner.ast_calls.load(Ordering::SeqCst), 1);
+
+        // The rebuilt entry matches the content, so it is served from the cache
+        let ast = server.get_or_fetch_ast(&uri, &path, A.as_bytes()).await;
+        assert_eq!(ast.unwrap().data["build"], "current");
+        assert_eq!(runner.ast_calls.load(Ordering::SeqCst), 1);
+
+        // Content that is not UTF-8 never matches a saved document, so nothing is fetched
+        let ast = server.get_or_fetch_ast(&uri, &path, &[0xff]).await;
+        assert!(ast.is_none());
+        assert_eq!(runner.ast_calls.load(Ordering::SeqCst), 1);
+    }
+
+    #[tokio::test]
+    async fn test_on_save_evicts_saved_file_and_its_dependents() {
+        let server = server(MockRunner::new(json!({})));
+        let (_dir, [a, b, _]) = workspace(&server, "contract A { uint x; }").await;
+
+        server.on_save(a.clone()).await;
+        assert!(!is_cached(&server, &a).await);
+        assert!(!is_cached(&server, &b).await);
+    }
+
+    #[tokio::test]
+    async fn test_on_save_keeps_unrelated_builds() {
+        let server = server(MockRunner::new(json!({})));
+        let (_dir, [a, _, c]) = workspace(&server, "contract A { uint x; }").await;
+
+        server.on_save(a).await;
+        assert!(is_cached(&server, &c).await);
+
+        // A save that leaves the content unchanged keeps every build
+        let (_dir, [a, b, c]) = workspace(&server, A).await;
+        server.on_save(a.clone()).await;
+        for uri in [&a, &b, &c] {
+            assert!(is_cached(&server, uri).await);
+        }
+    }
+}
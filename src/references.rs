@@ -1,8 +1,12 @@
 use serde_json::Value;
-use std::collections::{HashMap, HashSet};
+use std::{
+    collections::{HashMap, HashSet},
+    path::Path,
+};
 use tower_lsp::lsp_types::{Location, Position, Range, Url};
 
-use crate::goto::{NodeInfo, bytes_to_pos, cache_ids, pos_to_bytes};
+use crate::goto::{AstIndex, NodeInfo, pos_to_bytes};
+use crate::utils::{LineIndex, SrcLocation};
 
 /// Build a map of all reference relationships in the AST
 /// Returns a HashMap where keys are node IDs and values are vectors of related node IDs
@@ -23,92 +27,54 @@ pub fn all_references(nodes: &HashMap<String, HashMap<u64, NodeInfo>>) -> HashMa
     all_refs
 }
 
-/// Find the node ID at a specific byte position in a file
-pub fn byte_to_id(
-    nodes: &HashMap<String, HashMap<u64, NodeInfo>>,
-    abs_path: &str,
-    byte_position: usize,
-) -> Option<u64> {
-    let file_nodes = nodes.get(abs_path)?;
-    let mut refs: HashMap<usize, u64> = HashMap::new();
-
-    for (id, node_info) in file_nodes {
-        let src_parts: Vec<&str> = node_info.src.split(':').collect();
-        if src_parts.len() != 3 {
-            continue;
-        }
+/// The span locating `node`: its name if it has one, else the whole node
+fn node_span(node: &NodeInfo) -> SrcLocation {
+    node.name_location.unwrap_or(node.src)
+}
 
-        let start: usize = src_parts[0].parse().ok()?;
-        let length: usize = src_parts[1].parse().ok()?;
-        let end = start + length;
+/// A source file read once so any number of spans in it can be converted to
+/// locations
+#[derive(Debug)]
+pub struct SourceFile {
+    uri: Url,
+    len: usize,
+    lines: LineIndex,
+}
 
-        if start <= byte_position && byte_position < end {
-            let diff = end - start;
-            refs.entry(diff).or_insert(*id);
-        }
-    }
+impl SourceFile {
+    pub fn read(file_path: &str) -> Option<Self> {
+        let absolute_path = if std::path::Path::new(file_path).is_absolute() {
+            std::path::PathBuf::from(file_path)
+        } else {
+            std::env::current_dir().ok()?.join(file_path)
+        };
 
-    refs.keys().min().map(|min_diff| refs[min_diff])
-}
+        let source_bytes = std::fs::read(&absolute_path).ok()?;
+        let lines = LineIndex::new(&String::from_utf8_lossy(&source_bytes));
+        let uri = Url::from_file_path(&absolute_path).ok()?;
 
-/// Convert a node ID to a Location for LSP
-pub fn id_to_location(
-    nodes: &HashMap<String, HashMap<u64, NodeInfo>>,
-    id_to_path: &HashMap<String, String>,
-    node_id: u64,
-) -> Option<Location> {
-    // Find the file containing this node
-    let mut target_node: Option<&NodeInfo> = None;
-    for file_nodes in nodes.values() {
-        if let Some(node) = file_nodes.get(&node_id) {
-            target_node = Some(node);
-            break;
-        }
+        Some(Self {
+            uri,
+            len: source_bytes.len(),
+            lines,
+        })
     }
 
-    let node = target_node?;
-
-    // Get location from nameLocation or src
-    let (byte_str, length_str, file_id) = if let Some(name_location) = &node.name_location {
-        let parts: Vec<&str> = name_location.split(':').collect();
-        if parts.len() == 3 {
-            (parts[0], parts[1], parts[2])
-        } else {
+    pub fn location(&self, byte_offset: usize, length: usize) -> Option<Location> {
+        if byte_offset + length > self.len {
             return None;
         }
-    } else {
-        let parts: Vec<&str> = node.src.split(':').collect();
-        if parts.len() == 3 {
-            (parts[0], parts[1], parts[2])
-        } else {
-            return None;
-        }
-    };
-
-    let byte_offset: usize = byte_str.parse().ok()?;
-    let length: usize = length_str.parse().ok()?;
-    let file_path = id_to_path.get(file_id)?;
-
-    // Read the file to convert byte positions to line/column
-    let absolute_path = if std::path::Path::new(file_path).is_absolute() {
-        std::path::PathBuf::from(file_path)
-    } else {
-        std::env::current_dir().ok()?.join(file_path)
-    };
-
-    let source_bytes = std::fs::read(&absolute_path).ok()?;
-    let start_pos = bytes_to_pos(&source_bytes, byte_offset)?;
-    let end_pos = bytes_to_pos(&source_bytes, byte_offset + length)?;
-
-    let uri = Url::from_file_path(&absolute_path).ok()?;
-
-    Some(Location {
-        uri,
-        range: Range {
-            start: start_pos,
-            end: end_pos,
-        },
-    })
+        let ((start_line, start_col), (end_line, end_col)) =
+            self.lines.range(byte_offset, byte_offset + length);
+
+        Some(Location {
+            uri: self.uri.clone(),
+            range: Range {
+                start: Position::new(start_line, start_col),
+                end: Position::new(end_line, end_col),
+            },
+        })
+    }
 }
 
 /// Find all references to a symbol at the given position
@@ -118,44 +84,26 @@ pub fn goto_references(
     position: Position,
     source_bytes: &[u8],
 ) -> Vec<Location> {
-    let sources = match ast_data.get("sources") {
-        Some(s) => s,
-        None => return vec![],
+    let Ok(file_path) = file_uri.to_file_path() else {
+        return vec![];
     };
+    match AstIndex::new(ast_data) {
+        Some(index) => goto_references_in(&index, &file_path, pos_to_bytes(source_bytes, position)),
+        None => vec![],
+    }
+}
 
-    let build_infos = match ast_data.get("build_infos").and_then(|v| v.as_array()) {
-        Some(infos) => infos,
-        None => return vec![],
-    };
-
-    let first_build_info = match build_infos.first() {
-        Some(info) => info,
-        None => return vec![],
-    };
-
-    let id_to_path = match first_build_info
-        .get("source_id_to_path")
-        .and_then(|v| v.as_object())
-    {
-        Some(map) => map,
-        None => return vec![],
-    };
-
-    let id_to_path_map: HashMap<String, String> = id_to_path
-        .iter()
-        .map(|(k, v)| (k.clone(), v.as_str().unwrap_or("").to_string()))
-        .collect();
-
-    let (nodes, path_to_abs) = cache_ids(sources);
-    let all_refs = all_references(&nodes);
-
-    // Get the file path and convert to absolute path
-    let path = match file_uri.to_file_path() {
-        Ok(p) => p,
-        Err(_) => return vec![],
-    };
+/// [`goto_references`] against an already built [`AstIndex`], for a cursor already
+/// converted to its byte offset in the document at `file_path`
+pub fn goto_references_in(
+    index: &AstIndex,
+    file_path: &Path,
+    byte_position: usize,
+) -> Vec<Location> {
+    let AstIndex { path_to_abs, .. } = index;
 
-    let path_str = match path.to_str() {
+    // Get the absolute path the AST knows the file by
+    let path_str = match file_path.to_str() {
         Some(s) => s,
         None => return vec![],
     };
@@ -165,11 +113,8 @@ pub fn goto_references(
         None => return vec![],
     };
 
-    // Convert position to byte offset
-    let byte_position = pos_to_bytes(source_bytes, position);
-
     // Find the node ID at this position
-    let node_id = match byte_to_id(&nodes, abs_path, byte_position) {
+    let node_id = match index.node_at(abs_path, byte_position) {
         Some(id) => id,
         None => return vec![],
     };
@@ -177,12 +122,7 @@ pub fn goto_references(
     // Determine the target node ID for finding references
     // If this is a usage node, get its declaration; otherwise use the node itself
     let target_node_id = {
-        let file_nodes = match nodes.get(abs_path) {
-            Some(nodes) => nodes,
-            None => return vec![],
-        };
-
-        if let Some(node_info) = file_nodes.get(&node_id) {
+        if let Some(node_info) = index.node(node_id) {
             // If this node references a declaration, use the declaration as the target
             // This ensures we get ALL references to the same symbol
             node_info.referenced_declaration.unwrap_or(node_id)
@@ -191,45 +131,50 @@ pub fn goto_references(
         }
     };
 
+    // Every reference to a symbol resolves to the same target, so its locations are
+    // only converted by the first request for any of them
+    index.reference_locations(target_node_id, || locate_references(index, target_node_id))
+}
+
+/// Locations of `target_node_id` and every node referencing it, or that it references
+fn locate_references(index: &AstIndex, target_node_id: u64) -> Vec<Location> {
     // Get all references for the target node (declaration)
     let mut results = HashSet::new();
     results.insert(target_node_id); // Always include the target node itself (the declaration)
 
     // Add any references to this node
-    if let Some(refs) = all_refs.get(&target_node_id) {
+    if let Some(refs) = index.references.get(&target_node_id) {
         results.extend(refs.iter().copied());
     }
 
-    // Convert node IDs to locations
+    // Convert node IDs to locations. Nodes sharing a source span resolve to the
+    // same location, so duplicates are dropped, and each file is read at most once
+    // per build however many references it holds
+    let mut seen = HashSet::new();
     let mut locations = Vec::new();
     for id in results {
-        if let Some(location) = id_to_location(&nodes, &id_to_path_map, id) {
-            locations.push(location);
+        let Some(node) = index.node(id) else {
+            continue;
+        };
+        let span = node_span(node);
+        if !seen.insert(span) {
+            continue;
         }
-    }
-
-    // Remove duplicate locations
-    let mut unique_locations = Vec::new();
-    let mut seen = std::collections::HashSet::new();
-    for location in locations {
-        let key = (
-            location.uri.clone(),
-            location.range.start.line,
-            location.range.start.character,
-            location.range.end.line,
-            location.range.end.character,
-        );
-        if seen.insert(key) {
-            unique_locations.push(location);
+        if let Some(location) = index
+            .source_file(span.file_id())
+            .and_then(|file| file.location(span.start(), span.length()))
+        {
+            locations.push(location);
         }
     }
 
-    unique_locations
+    locations
 }
 
 #[cfg(test)]
 mod tests {
     use super::*;
+    use crate::goto::cache_ids;
     use std::process::Command;
 
     fn get_ast_data() -> Option<Value> {
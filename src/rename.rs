@@ -1,52 +1,49 @@
 use serde_json::Value;
-use std::collections::HashMap;
+use std::{collections::HashMap, path::Path};
 use tower_lsp::lsp_types::{Position, TextEdit, Url, WorkspaceEdit};
 
-use crate::references;
+use crate::{
+    goto::{AstIndex, pos_to_bytes},
+    references,
+    utils::is_identifier_byte,
+};
 
 /// Extract the identifier (word) at the given position in the source bytes
 pub fn get_identifier_at_position(source_bytes: &[u8], position: Position) -> Option<String> {
-    let text = String::from_utf8_lossy(source_bytes);
-    let lines: Vec<&str> = text.lines().collect();
-
-    if position.line as usize >= lines.len() {
-        return None;
-    }
-
-    let line = lines[position.line as usize];
-    if position.character as usize > line.len() {
+    // Only the cursor's line is needed, so stop there instead of collecting all lines
+    let line = source_bytes
+        .split(|&b| b == b'\n')
+        .nth(position.line as usize)?;
+    let line = line.strip_suffix(b"\r").unwrap_or(line);
+    let character = position.character as usize;
+    if character > line.len() {
         return None;
     }
 
-    // Find the word boundaries around the character position
-    let mut start = position.character as usize;
-    let mut end = position.character as usize;
-
-    // Move start backwards to find word start
-    while start > 0
-        && (line.as_bytes()[start - 1].is_ascii_alphanumeric()
-            || line.as_bytes()[start - 1] == b'_')
-    {
-        start -= 1;
-    }
-
-    // Move end forwards to find word end
-    while end < line.len()
-        && (line.as_bytes()[end].is_ascii_alphanumeric() || line.as_bytes()[end] == b'_')
-    {
-        end += 1;
-    }
+    // Find the word boundaries around the character position, scanning each way
+    // for the first byte that can't be part of an identifier
+    let start = line[..character]
+        .iter()
+        .rposition(|&b| !is_identifier_byte(b))
+        .map_or(0, |i| i + 1);
+    let end = line[character..]
+        .iter()
+        .position(|&b| !is_identifier_byte(b))
+        .map_or(line.len(), |i| character + i);
 
     if start == end {
         return None; // No word found
     }
 
     // Check if it starts with a digit (not a valid identifier)
-    if line.as_bytes()[start].is_ascii_digit() {
+    if line[start].is_ascii_digit() {
         return None;
     }
 
-    Some(line[start..end].to_string())
+    // Identifier bytes are ASCII, so the word is always valid UTF-8
+    std::str::from_utf8(&line[start..end])
+        .ok()
+        .map(str::to_string)
 }
 
 /// Handle a rename request by finding all references to the symbol at the given position
@@ -55,12 +52,26 @@ pub fn rename_symbol(
     ast_data: &Value,
     file_uri: &Url,
     position: Position,
-    _source_bytes: &[u8],
+    source_bytes: &[u8],
+    new_name: String,
+) -> Option<WorkspaceEdit> {
+    let index = AstIndex::new(ast_data)?;
+    let file_path = file_uri.to_file_path().ok()?;
+    let byte_position = pos_to_bytes(source_bytes, position);
+    rename_symbol_in(&index, &file_path, byte_position, new_name)
+}
+
+/// [`rename_symbol`] against an already built [`AstIndex`], for a cursor already
+/// converted to its byte offset in the document at `file_path`
+pub fn rename_symbol_in(
+    index: &AstIndex,
+    file_path: &Path,
+    byte_position: usize,
     new_name: String,
 ) -> Option<WorkspaceEdit> {
     // Get all locations for renaming (declaration + references)
     // The AST provides exact ranges, so we use them directly
-    let locations = references::goto_references(ast_data, file_uri, position, _source_bytes);
+    let locations = references::goto_references_in(index, file_path, byte_position);
 
     if locations.is_empty() {
         return None;
@@ -78,8 +89,6 @@ pub fn rename_symbol(
         changes.entry(location.uri).or_default().push(text_edit);
     }
 
-
-
     Some(WorkspaceEdit {
         changes: Some(changes),
         document_changes: None,
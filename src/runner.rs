@@ -16,6 +16,14 @@ pub trait Runner: Send + Sync {
     async fn lint(&self, file: &str) -> Result<serde_json::Value, RunnerError>;
     async fn ast(&self, file: &str) -> Result<serde_json::Value, RunnerError>;
     async fn get_build_diagnostics(&self, file: &Url) -> Result<Vec<Diagnostic>, RunnerError>;
+    /// Build diagnostics together with the build output they came from, which
+    /// carries the AST, so callers needing both only run forge once. `content` is
+    /// the text of `file`, used to map compiler offsets to positions
+    async fn get_build_diagnostics_and_ast(
+        &self,
+        file: &Url,
+        content: &str,
+    ) -> Result<(Vec<Diagnostic>, serde_json::Value), RunnerError>;
     async fn get_lint_diagnostics(&self, file: &Url) -> Result<Vec<Diagnostic>, RunnerError>;
 }
 
@@ -30,24 +38,7 @@ impl Runner for ForgeRunner {
             .output()
             .await?;
 
-        let stderr_str = String::from_utf8_lossy(&output.stderr);
-
-        // Parse JSON output line by line
-        let mut diagnostics = Vec::new();
-        for line in stderr_str.lines() {
-            if line.trim().is_empty() {
-                continue;
-            }
-
-            match serde_json::from_str::<serde_json::Value>(line) {
-                Ok(value) => diagnostics.push(value),
-                Err(_e) => {
-                    continue;
-                }
-            }
-        }
-
-        Ok(serde_json::Value::Array(diagnostics))
+        Ok(parse_lint_output(&output.stderr))
     }
 
     async fn build(&self, file_path: &str) -> Result<serde_json::Value, RunnerError> {
@@ -62,10 +53,7 @@ impl Runner for ForgeRunner {
             .output()
             .await?;
 
-        let stdout_str = String::from_utf8_lossy(&output.stdout);
-        let parsed: serde_json::Value = serde_json::from_str(&stdout_str)?;
-
-        Ok(parsed)
+        parse_build_output(&output.stdout)
     }
 
     async fn ast(&self, file_path: &str) -> Result<serde_json::Value, RunnerError> {
@@ -80,10 +68,7 @@ impl Runner for ForgeRunner {
             .output()
             .await?;
 
-        let stdout_str = String::from_utf8_lossy(&output.stdout);
-        let parsed: serde_json::Value = serde_json::from_str(&stdout_str)?;
-
-        Ok(parsed)
+        parse_build_output(&output.stdout)
     }
 
     async fn get_lint_diagnostics(&self, file: &Url) -> Result<Vec<Diagnostic>, RunnerError> {
@@ -95,21 +80,105 @@ impl Runner for ForgeRunner {
     }
 
     async fn get_build_diagnostics(&self, file: &Url) -> Result<Vec<Diagnostic>, RunnerError> {
+        let path = file.to_file_path().map_err(|_| RunnerError::InvalidUrl)?;
+        let content = tokio::fs::read_to_string(&path)
+            .await
+            .map_err(|_| RunnerError::ReadError)?;
+        let (diagnostics, _) = self.get_build_diagnostics_and_ast(file, &content).await?;
+        Ok(diagnostics)
+    }
+
+    async fn get_build_diagnostics_and_ast(
+        &self,
+        file: &Url,
+        content: &str,
+    ) -> Result<(Vec<Diagnostic>, serde_json::Value), RunnerError> {
         let path = file.to_file_path().map_err(|_| RunnerError::InvalidUrl)?;
         let path_str = path.to_str().ok_or(RunnerError::InvalidUrl)?;
         let filename = path
             .file_name()
             .and_then(|os_str| os_str.to_str())
             .ok_or(RunnerError::InvalidUrl)?;
-        let content = tokio::fs::read_to_string(&path)
-            .await
-            .map_err(|_| RunnerError::ReadError)?;
         let build_output = self.build(path_str).await?;
-        let diagnostics = build_output_to_diagnostics(&build_output, filename, &content);
-        Ok(diagnostics)
+        let diagnostics = build_output_to_diagnostics(&build_output, filename, content);
+        Ok((diagnostics, build_output))
+    }
+}
+
+/// The parts of `forge build --json` output the server reads. Everything else,
+/// notably the ABI and bytecode of every contract under `contracts`, is skipped by
+/// the parser instead of being built into a JSON tree that is never looked at
+#[derive(Debug, Deserialize)]
+struct BuildOutput {
+    errors: Option<serde_json::Value>,
+    sources: Option<serde_json::Value>,
+    build_infos: Option<serde_json::Value>,
+}
+
+impl From<BuildOutput> for serde_json::Value {
+    fn from(output: BuildOutput) -> Self {
+        let fields = [
+            ("errors", output.errors),
+            ("sources", output.sources),
+            ("build_infos", output.build_infos),
+        ];
+        fields
+            .into_iter()
+            .filter_map(|(key, value)| Some((key.to_string(), value?)))
+            .collect::<serde_json::Map<_, _>>()
+            .into()
     }
 }
 
+/// Parse the JSON printed by `forge build --json`. Clean output parses in a single
+/// strict pass; only when that fails is the document re-parsed from its first `{`,
+/// skipping anything forge printed ahead of it
+fn parse_build_output(stdout: &[u8]) -> Result<serde_json::Value, RunnerError> {
+    if stdout.trim_ascii().is_empty() {
+        return Err(RunnerError::EmptyOutput);
+    }
+
+    let parsed = match serde_json::from_slice::<BuildOutput>(stdout) {
+        Ok(parsed) => parsed,
+        Err(e) => match stdout.iter().position(|&b| b == b'{') {
+            Some(start) if start > 0 => serde_json::from_slice(&stdout[start..])?,
+            _ => return Err(e.into()),
+        },
+    };
+    Ok(parsed.into())
+}
+
+/// Collect the diagnostics `forge lint --json` prints to stderr, one JSON object per
+/// line. Output holding nothing else parses as a single stream of values; only when
+/// that fails is it split into lines and anything that is not an object skipped
+fn parse_lint_output(stderr: &[u8]) -> serde_json::Value {
+    let stream = serde_json::Deserializer::from_slice(stderr)
+        .into_iter::<serde_json::Value>()
+        .collect::<Result<Vec<_>, _>>();
+    if let Ok(diagnostics) = stream {
+        return serde_json::Value::Array(diagnostics);
+    }
+
+    let stderr_str = String::from_utf8_lossy(stderr);
+    let mut diagnostics = Vec::new();
+    for line in stderr_str.lines() {
+        // Diagnostics are JSON objects; skip blank lines and plain-text output
+        // without handing them to the parser
+        if !line.trim_start().starts_with('{') {
+            continue;
+        }
+
+        match serde_json::from_str::<serde_json::Value>(line) {
+            Ok(value) => diagnostics.push(value),
+            Err(_e) => {
+                continue;
+            }
+        }
+    }
+
+    serde_json::Value::Array(diagnostics)
+}
+
 #[derive(Error, Debug)]
 pub enum RunnerError {
     #[error("Invalid file URL")]
@@ -153,3 +222,40 @@ pub struct CompileOutput {
     contracts: serde_json::Value,
     build_infos: Vec<serde_json::Value>,
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_parse_build_output() {
+        let parsed =
+            parse_build_output(br#"{"errors":[],"sources":{},"contracts":{"A":{}}}"#).unwrap();
+        assert!(parsed.get("sources").is_some());
+        assert!(parsed.get("contracts").is_none());
+        assert!(parsed.get("build_infos").is_none());
+
+        let parsed = parse_build_output(b"Compiling 1 files\n{\"errors\":[]}\n").unwrap();
+        assert!(parsed.get("errors").is_some());
+
+        assert!(matches!(
+            parse_build_output(b" \n"),
+            Err(RunnerError::EmptyOutput)
+        ));
+        assert!(matches!(
+            parse_build_output(b"not json"),
+            Err(RunnerError::JsonError(_))
+        ));
+    }
+
+    #[test]
+    fn test_parse_lint_output() {
+        let parsed = parse_lint_output(b"{\"a\":1}\n{\"b\":2}\n");
+        assert_eq!(parsed.as_array().unwrap().len(), 2);
+
+        let parsed = parse_lint_output(b"warning: nightly build\n{\"a\":1}\n\n{\"b\":");
+        assert_eq!(parsed, serde_json::json!([{"a": 1}]));
+
+        assert_eq!(parse_lint_output(b""), serde_json::json!([]));
+    }
+}
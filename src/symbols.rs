@@ -2,11 +2,13 @@
 
 use serde_json::Value;
 use tower_lsp::lsp_types::{DocumentSymbol, Location, Range, SymbolInformation, SymbolKind, Url, Position};
-use crate::utils::byte_offset_to_position;
+use crate::utils::{LineIndex, parse_src};
 
 pub fn extract_symbols(ast_data: &Value) -> Vec<SymbolInformation> {
     let mut symbols = Vec::new();
     let mut seen = std::collections::HashSet::new();
+    // Shared by the walks of all sources, each of which leaves it empty
+    let mut stack = Vec::new();
 
     if let Some(sources) = ast_data.get("sources")
         && let Some(sources_obj) = sources.as_object() {
@@ -15,14 +17,13 @@ pub fn extract_symbols(ast_data: &Value) -> Vec<SymbolInformation> {
                     && let Some(first_content) = contents_array.first()
                         && let Some(source_file) = first_content.get("source_file")
                             && let Some(ast) = source_file.get("ast") {
-                                let file_symbols = extract_symbols_from_ast(ast, path);
+                                let file_symbols = extract_symbols_from_ast(ast, path, &mut stack);
                                 for symbol in file_symbols {
-                                    // Deduplicate based on location (URI + range)
-                                    let key = format!("{}:{:?}:{:?}",
-                                        symbol.location.uri,
-                                        symbol.location.range.start,
-                                        symbol.location.range.end
-                                    );
+                                    // Deduplicate based on location. Every symbol of a
+                                    // source shares its URI, so the source key stands in
+                                    // for it and no string is formatted per symbol
+                                    let Range { start, end } = symbol.location.range;
+                                    let key = (path.as_str(), start.line, start.character, end.line, end.character);
                                      if seen.insert(key) {
                                          symbols.push(symbol);
                                      }
@@ -34,13 +35,69 @@ pub fn extract_symbols(ast_data: &Value) -> Vec<SymbolInformation> {
      symbols
 }
 
+/// Workspace symbols with their lowercased names, built once per workspace build
+/// so that `workspace/symbol` queries only filter. The names are lowercased into
+/// one buffer, so building the index allocates once rather than once per symbol,
+/// and a query is a single substring search over that buffer
+pub struct SymbolIndex {
+    /// Lowercased names, each followed by a newline
+    names: String,
+    /// Offset in `names` at which the name of each symbol starts
+    name_starts: Vec<usize>,
+    symbols: Vec<SymbolInformation>,
+}
+
+impl SymbolIndex {
+    pub fn new(symbols: Vec<SymbolInformation>) -> Self {
+        let mut names = String::with_capacity(symbols.iter().map(|symbol| symbol.name.len() + 1).sum());
+        let mut name_starts = Vec::with_capacity(symbols.len());
+        for symbol in &symbols {
+            name_starts.push(names.len());
+            names.push_str(&symbol.name);
+            names.push('\n');
+        }
+        // Solidity identifiers are ASCII, so ASCII case folding is exact and skips
+        // the Unicode case tables
+        names.make_ascii_lowercase();
+        Self { names, name_starts, symbols }
+    }
+
+    /// Symbols whose name contains `query`, ignoring ASCII case
+    pub fn search(&self, query: &str) -> Vec<SymbolInformation> {
+        // Clients send an empty query to list everything, which needs no scan
+        if query.is_empty() {
+            return self.symbols.clone();
+        }
+
+        let query = query.to_ascii_lowercase();
+        // Names never contain a newline, so a match never spans two of them
+        if query.contains('\n') {
+            return Vec::new();
+        }
+
+        let mut results = Vec::new();
+        let mut last_match = None;
+        for (offset, _) in self.names.match_indices(&query) {
+            let i = self.name_starts.partition_point(|&start| start <= offset) - 1;
+            // A name can contain the query more than once
+            if last_match != Some(i) {
+                results.push(self.symbols[i].clone());
+                last_match = Some(i);
+            }
+        }
+        results
+    }
+}
+
 pub fn extract_document_symbols(ast_data: &Value, file_path: &str) -> Vec<DocumentSymbol> {
     let mut symbols = Vec::new();
 
     if let Some(sources) = ast_data.get("sources")
         && let Some(sources_obj) = sources.as_object() {
             for (path, contents) in sources_obj {
-                if (path == file_path || path.ends_with(&format!("/{}", file_path)) || path.ends_with(file_path))
+                // An exact match or a `/file_path` suffix both end with `file_path`, so
+                // one suffix test covers them without formatting a string per source
+                if path.ends_with(file_path)
                     && let Some(contents_array) = contents.as_array()
                     && let Some(first_content) = contents_array.first()
                     && let Some(source_file) = first_content.get("source_file")
@@ -56,110 +113,35 @@ pub fn extract_document_symbols(ast_data: &Value, file_path: &str) -> Vec<Docume
 
 fn extract_document_symbols_from_ast(ast: &Value, file_path: &str) -> Vec<DocumentSymbol> {
     let mut symbols = Vec::new();
+    // Read the file once to convert the byte offsets of all its symbols
+    let Ok(content) = std::fs::read_to_string(file_path) else {
+        return symbols;
+    };
+    let lines = &LineIndex::new(&content);
 
-    // First, find all top-level nodes (contracts, interfaces, libraries, etc.)
+    // First, find all top-level nodes (contracts, interfaces, libraries, etc.),
+    // each through the builder for its node type
     if let Some(nodes) = ast.get("nodes").and_then(|v| v.as_array()) {
-        for node in nodes {
-            if let Some(node_type) = node.get("nodeType").and_then(|v| v.as_str()) {
-                match node_type {
-                    "ContractDefinition" | "InterfaceDefinition" | "LibraryDefinition" => {
-                        if let Some(symbol) = create_contract_document_symbol_with_children(node, file_path) {
-                            symbols.push(symbol);
-                        }
-                    }
-                    "UsingForDirective" => {
-                        if let Some(symbol) = create_using_for_document_symbol(node, file_path) {
-                            symbols.push(symbol);
-                        }
-                    }
-                    "ImportDirective" => {
-                        if let Some(symbol) = create_import_document_symbol(node, file_path) {
-                            symbols.push(symbol);
-                        }
-                    }
-                    "PragmaDirective" => {
-                        if let Some(symbol) = create_pragma_document_symbol(node, file_path) {
-                            symbols.push(symbol);
-                        }
-                    }
-                    _ => {}
-                }
-            }
-        }
+        symbols.extend(nodes.iter().filter_map(|node| {
+            let node_type = node.get("nodeType").and_then(|v| v.as_str())?;
+            top_level_builder(node_type)?(node, lines)
+        }));
     }
 
     symbols
 }
 
-fn create_contract_document_symbol_with_children(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
+fn create_contract_document_symbol_with_children(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
     let mut children = Vec::new();
 
-    // Process contract members
+    // Process contract members, each through the builder for its node type
     if let Some(nodes) = node.get("nodes").and_then(|v| v.as_array()) {
-        for member_node in nodes {
-            if let Some(node_type) = member_node.get("nodeType").and_then(|v| v.as_str()) {
-                match node_type {
-                    "FunctionDefinition" => {
-                        if let Some(symbol) = create_function_document_symbol_with_children(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "VariableDeclaration" => {
-                        if let Some(symbol) = create_variable_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "EventDefinition" => {
-                        if let Some(symbol) = create_event_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "ModifierDefinition" => {
-                        if let Some(symbol) = create_modifier_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "StructDefinition" => {
-                        if let Some(symbol) = create_struct_document_symbol_with_children(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "EnumDefinition" => {
-                        if let Some(symbol) = create_enum_document_symbol_with_children(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "ConstructorDefinition" => {
-                        if let Some(symbol) = create_constructor_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "ErrorDefinition" => {
-                        if let Some(symbol) = create_error_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "UsingForDirective" => {
-                        if let Some(symbol) = create_using_for_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "FallbackFunctionDefinition" => {
-                        if let Some(symbol) = create_fallback_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    "ReceiveFunctionDefinition" => {
-                        if let Some(symbol) = create_receive_document_symbol(member_node, file_path) {
-                            children.push(symbol);
-                        }
-                    }
-                    _ => {}
-                }
-            }
-        }
+        children.extend(nodes.iter().filter_map(|member_node| {
+            let node_type = member_node.get("nodeType").and_then(|v| v.as_str())?;
+            contract_member_builder(node_type)?(member_node, lines)
+        }));
     }
 
     Some(DocumentSymbol {
@@ -176,8 +158,82 @@ fn create_contract_document_symbol_with_children(node: &Value, file_path: &str)
 
 
 
-fn create_function_document_symbol_with_children(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
+/// Builds the outline symbol of one AST node
+type DocumentSymbolBuilder = fn(&Value, &LineIndex) -> Option<DocumentSymbol>;
+
+/// Builder for a source-level node with `node_type`, or `None` for nodes the
+/// outline leaves out
+fn top_level_builder(node_type: &str) -> Option<DocumentSymbolBuilder> {
+    let builder: DocumentSymbolBuilder = match node_type {
+        "ContractDefinition" | "InterfaceDefinition" | "LibraryDefinition" => {
+            create_contract_document_symbol_with_children
+        }
+        "UsingForDirective" => create_using_for_document_symbol,
+        "ImportDirective" => create_import_document_symbol,
+        "PragmaDirective" => create_pragma_document_symbol,
+        _ => return None,
+    };
+    Some(builder)
+}
+
+/// Builder for a contract member with `node_type`, or `None` for members the
+/// outline leaves out. One lookup picks the builder, so members go through a
+/// single call and push
+fn contract_member_builder(node_type: &str) -> Option<DocumentSymbolBuilder> {
+    let builder: DocumentSymbolBuilder = match node_type {
+        "FunctionDefinition" => create_function_document_symbol_with_children,
+        "VariableDeclaration" => create_variable_document_symbol,
+        "EventDefinition" => |node, lines| named_document_symbol(node, lines, SymbolKind::EVENT),
+        // Modifiers are represented as methods
+        "ModifierDefinition" => |node, lines| named_document_symbol(node, lines, SymbolKind::METHOD),
+        "StructDefinition" => create_struct_document_symbol_with_children,
+        "EnumDefinition" => create_enum_document_symbol_with_children,
+        "ConstructorDefinition" => |node, lines| {
+            fixed_name_document_symbol(node, lines, "constructor", SymbolKind::CONSTRUCTOR)
+        },
+        // Errors are similar to events in Solidity
+        "ErrorDefinition" => |node, lines| named_document_symbol(node, lines, SymbolKind::EVENT),
+        "UsingForDirective" => create_using_for_document_symbol,
+        "FallbackFunctionDefinition" => |node, lines| {
+            fixed_name_document_symbol(node, lines, "fallback", SymbolKind::FUNCTION)
+        },
+        "ReceiveFunctionDefinition" => |node, lines| {
+            fixed_name_document_symbol(node, lines, "receive", SymbolKind::FUNCTION)
+        },
+        _ => return None,
+    };
+    Some(builder)
+}
+
+/// Outline symbol without children for a node whose `name` field names it. Most
+/// members the outline shows have this shape and only differ in their kind
+fn named_document_symbol(node: &Value, lines: &LineIndex, kind: SymbolKind) -> Option<DocumentSymbol> {
+    let name = node.get("name").and_then(|v| v.as_str())?;
+    fixed_name_document_symbol(node, lines, name, kind)
+}
+
+/// Outline symbol without children for a node shown under `name`
+fn fixed_name_document_symbol(
+    node: &Value,
+    lines: &LineIndex,
+    name: &str,
+    kind: SymbolKind,
+) -> Option<DocumentSymbol> {
+    let range = get_node_range(node, lines)?;
+
+    Some(DocumentSymbol {
+        name: name.to_string(),
+        detail: None,
+        kind,
+        range,
+        selection_range: range,
+        children: None,
+        tags: None,
+        deprecated: None,
+    })
+}
+
+fn create_function_document_symbol_with_children(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let is_constructor = node.get("kind").and_then(|v| v.as_str()) == Some("constructor");
 
     let name = if is_constructor {
@@ -194,17 +250,22 @@ fn create_function_document_symbol_with_children(node: &Value, file_path: &str)
     } else {
         SymbolKind::FUNCTION
     };
+    let range = get_node_range(node, lines)?;
 
     // Extract parameters as children
     let mut children = Vec::new();
 
-    // Try different AST structures for parameters
-    let param_array = node.get("parameters").and_then(|p| p.get("parameters")).and_then(|p| p.as_array())
-        .or_else(|| node.get("parameters").and_then(|p| p.as_array()));
+    // A function has a single parameter list, either a ParameterList node holding
+    // the parameters or, in some AST versions, the bare array of them
+    let param_array = match node.get("parameters") {
+        Some(Value::Array(parameters)) => Some(parameters),
+        Some(parameter_list) => parameter_list.get("parameters").and_then(|p| p.as_array()),
+        None => None,
+    };
 
     if let Some(parameters) = param_array {
         for param in parameters {
-            if let Some(param_symbol) = create_parameter_document_symbol(param, file_path) {
+            if let Some(param_symbol) = create_parameter_document_symbol(param, lines) {
                 children.push(param_symbol);
             }
         }
@@ -222,9 +283,9 @@ fn create_function_document_symbol_with_children(node: &Value, file_path: &str)
     })
 }
 
-fn create_variable_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
+fn create_variable_document_symbol(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
 
     // Determine if this is a state variable or local variable
     let kind = if is_state_variable(node) {
@@ -245,47 +306,15 @@ fn create_variable_document_symbol(node: &Value, file_path: &str) -> Option<Docu
     })
 }
 
-fn create_event_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
+fn create_struct_document_symbol_with_children(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: name.to_string(),
-        detail: None,
-        kind: SymbolKind::EVENT,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_modifier_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: name.to_string(),
-        detail: None,
-        kind: SymbolKind::METHOD, // Modifiers are represented as methods
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_struct_document_symbol_with_children(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
 
     // Extract struct members as children
     let mut children = Vec::new();
     if let Some(members) = node.get("members").and_then(|v| v.as_array()) {
         for member in members {
-            if let Some(member_symbol) = create_struct_member_document_symbol(member, file_path) {
+            if let Some(member_symbol) = named_document_symbol(member, lines, SymbolKind::FIELD) {
                 children.push(member_symbol);
             }
         }
@@ -303,31 +332,15 @@ fn create_struct_document_symbol_with_children(node: &Value, file_path: &str) ->
     })
 }
 
-fn create_struct_member_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
+fn create_enum_document_symbol_with_children(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: name.to_string(),
-        detail: None,
-        kind: SymbolKind::FIELD,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_enum_document_symbol_with_children(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
 
     // Extract enum members as children
     let mut children = Vec::new();
     if let Some(members) = node.get("members").and_then(|v| v.as_array()) {
         for member in members {
-            if let Some(member_symbol) = create_enum_member_document_symbol(member, file_path) {
+            if let Some(member_symbol) = named_document_symbol(member, lines, SymbolKind::ENUM) {
                 children.push(member_symbol);
             }
         }
@@ -345,91 +358,14 @@ fn create_enum_document_symbol_with_children(node: &Value, file_path: &str) -> O
     })
 }
 
-fn create_enum_member_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: name.to_string(),
-        detail: None,
-        kind: SymbolKind::ENUM,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_constructor_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: "constructor".to_string(),
-        detail: None,
-        kind: SymbolKind::CONSTRUCTOR,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_error_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: name.to_string(),
-        detail: None,
-        kind: SymbolKind::EVENT, // Errors are similar to events in Solidity
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_fallback_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: "fallback".to_string(),
-        detail: None,
-        kind: SymbolKind::FUNCTION,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_receive_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
-
-    Some(DocumentSymbol {
-        name: "receive".to_string(),
-        detail: None,
-        kind: SymbolKind::FUNCTION,
-        range,
-        selection_range: range,
-        children: None,
-        tags: None,
-        deprecated: None,
-    })
-}
-
-fn create_parameter_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
+fn create_parameter_document_symbol(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
     let name = node.get("name").and_then(|v| v.as_str())?;
     // Skip unnamed parameters
     if name.is_empty() {
         return None;
     }
 
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
 
     Some(DocumentSymbol {
         name: name.to_string(),
@@ -445,29 +381,28 @@ fn create_parameter_document_symbol(node: &Value, file_path: &str) -> Option<Doc
 
 
 
-fn create_using_for_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
+fn create_using_for_document_symbol(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
+    let range = get_node_range(node, lines)?;
 
-    // Build the name from the AST data
-    let mut name_parts = Vec::new();
-    name_parts.push("using".to_string());
+    // Build the name from the AST data, straight into one string
+    let mut name = String::from("using");
 
     // Add library name if present
     if let Some(library_name) = node.get("libraryName")
         && let Some(id) = library_name.get("name").and_then(|v| v.as_str()) {
-            name_parts.push(id.to_string());
+            name.push(' ');
+            name.push_str(id);
         }
 
-    name_parts.push("for".to_string());
+    name.push_str(" for");
 
     // Add type name if present
     if let Some(type_name) = node.get("typeName")
         && let Some(name_str) = extract_type_name(type_name) {
-            name_parts.push(name_str);
+            name.push(' ');
+            name.push_str(name_str);
         }
 
-    let name = name_parts.join(" ");
-
     Some(DocumentSymbol {
         name,
         detail: None,
@@ -480,27 +415,20 @@ fn create_using_for_document_symbol(node: &Value, file_path: &str) -> Option<Doc
     })
 }
 
-fn extract_type_name(type_node: &Value) -> Option<String> {
-    if let Some(node_type) = type_node.get("nodeType").and_then(|v| v.as_str()) {
-        match node_type {
-            "ElementaryTypeName" => {
-                type_node.get("name").and_then(|v| v.as_str()).map(|s| s.to_string())
-            }
-            "UserDefinedTypeName" => {
-                type_node.get("name").and_then(|v| v.as_str()).map(|s| s.to_string())
-            }
-            "Mapping" => {
-                Some("mapping".to_string())
-            }
-            _ => None
+/// Name of the type `type_node` describes, borrowed from the AST
+fn extract_type_name(type_node: &Value) -> Option<&str> {
+    match type_node.get("nodeType").and_then(|v| v.as_str())? {
+        // Both kinds of type name carry it in their `name` field
+        "ElementaryTypeName" | "UserDefinedTypeName" => {
+            type_node.get("name").and_then(|v| v.as_str())
         }
-    } else {
-        None
+        "Mapping" => Some("mapping"),
+        _ => None,
     }
 }
 
-fn create_import_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
+fn create_import_document_symbol(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
+    let range = get_node_range(node, lines)?;
 
     // Try to get the file name being imported
     let name = if let Some(file) = node.get("file").and_then(|v| v.as_str()) {
@@ -521,25 +449,26 @@ fn create_import_document_symbol(node: &Value, file_path: &str) -> Option<Docume
     })
 }
 
-fn create_pragma_document_symbol(node: &Value, file_path: &str) -> Option<DocumentSymbol> {
-    let range = get_node_range(node, file_path)?;
+fn create_pragma_document_symbol(node: &Value, lines: &LineIndex) -> Option<DocumentSymbol> {
+    let range = get_node_range(node, lines)?;
 
     // Extract a clean pragma name
     let name = if let Some(literals) = node.get("literals").and_then(|v| v.as_array()) {
-        let parts: Vec<String> = literals.iter()
+        // Trim spaces from each part, borrowing them from the AST
+        let parts: Vec<&str> = literals.iter()
             .filter_map(|v| v.as_str())
-            .map(|s| s.trim().to_string()) // Trim spaces from each part
+            .map(str::trim)
             .collect();
 
-        if parts.len() >= 2 && parts[0] == "solidity" {
+        match parts.as_slice() {
             // For solidity pragmas, join all version parts without spaces
             // e.g., ["solidity", "^0.8.0"] -> "solidity ^0.8.0"
             // or ["solidity", ">=", "0.8.0", "<", "0.9.0"] -> "solidity >=0.8.0<0.9.0"
-            let version_parts: Vec<String> = parts[1..].to_vec();
-            format!("{} {}", parts[0], version_parts.join(""))
-        } else {
+            ["solidity", versions @ ..] if !versions.is_empty() => {
+                format!("solidity {}", versions.concat())
+            }
             // For other pragmas, show the joined text
-            format!("pragma{}", parts.join(""))
+            _ => format!("pragma{}", parts.concat()),
         }
     } else {
         "pragma".to_string()
@@ -557,70 +486,77 @@ fn create_pragma_document_symbol(node: &Value, file_path: &str) -> Option<Docume
     })
 }
 
-fn extract_symbols_from_ast(ast: &Value, file_path: &str) -> Vec<SymbolInformation> {
+fn extract_symbols_from_ast<'a>(ast: &'a Value, file_path: &str, stack: &mut Vec<&'a Value>) -> Vec<SymbolInformation> {
     let mut symbols = Vec::new();
-    let mut stack = vec![ast];
+    // Source keys are usually relative to the project forge ran in, which
+    // Url::from_file_path rejects, so resolve them the way goto does first
+    let absolute_path = if std::path::Path::new(file_path).is_absolute() {
+        std::path::PathBuf::from(file_path)
+    } else {
+        match std::env::current_dir() {
+            Ok(dir) => dir.join(file_path),
+            Err(_) => return symbols,
+        }
+    };
+    // Every symbol of the file shares its URI, so parse it once
+    let Ok(uri) = Url::from_file_path(&absolute_path) else {
+        return symbols;
+    };
+    // Read the file once to convert the byte offsets of all its symbols
+    let Ok(content) = std::fs::read_to_string(&absolute_path) else {
+        return symbols;
+    };
+    let lines = &LineIndex::new(&content);
+    stack.push(ast);
 
     while let Some(node) = stack.pop() {
-        if let Some(node_type) = node.get("nodeType").and_then(|v| v.as_str()) {
-            match node_type {
-                "ContractDefinition" => {
-                    if let Some(symbol) = create_contract_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "FunctionDefinition" => {
-                    if let Some(symbol) = create_function_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "VariableDeclaration" => {
-                    if let Some(symbol) = create_variable_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "EventDefinition" => {
-                    if let Some(symbol) = create_event_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "ModifierDefinition" => {
-                    if let Some(symbol) = create_modifier_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "StructDefinition" => {
-                    if let Some(symbol) = create_struct_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                "EnumDefinition" => {
-                    if let Some(symbol) = create_enum_symbol_info(node, file_path) {
-                        symbols.push(symbol);
-                    }
-                }
-                _ => {}
-            }
+        let node_type = node.get("nodeType").and_then(|v| v.as_str());
+        if let Some(build) = node_type.and_then(symbol_info_builder)
+            && let Some(symbol) = build(node, lines, &uri)
+        {
+            symbols.push(symbol);
         }
 
         // Add child nodes to stack
-        push_child_nodes(node, &mut stack);
+        push_child_nodes(node, stack);
     }
 
     symbols
 }
 
-fn create_contract_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
+/// Builds the workspace symbol of one AST node
+type SymbolInfoBuilder = fn(&Value, &LineIndex, &Url) -> Option<SymbolInformation>;
+
+/// Builder for a node with `node_type`, or `None` for nodes that aren't workspace
+/// symbols
+fn symbol_info_builder(node_type: &str) -> Option<SymbolInfoBuilder> {
+    let builder: SymbolInfoBuilder = match node_type {
+        "ContractDefinition" => |node, lines, uri| named_symbol_info(node, lines, uri, SymbolKind::CLASS),
+        "FunctionDefinition" => create_function_symbol_info,
+        "VariableDeclaration" => create_variable_symbol_info,
+        "EventDefinition" => |node, lines, uri| named_symbol_info(node, lines, uri, SymbolKind::EVENT),
+        // Modifiers are represented as methods
+        "ModifierDefinition" => |node, lines, uri| named_symbol_info(node, lines, uri, SymbolKind::METHOD),
+        "StructDefinition" | "EnumDefinition" => {
+            |node, lines, uri| named_symbol_info(node, lines, uri, SymbolKind::STRUCT)
+        }
+        _ => return None,
+    };
+    Some(builder)
+}
+
+/// Workspace symbol of `kind` for a node whose `name` field names it
+fn named_symbol_info(node: &Value, lines: &LineIndex, uri: &Url, kind: SymbolKind) -> Option<SymbolInformation> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
     let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
+        uri: uri.clone(),
         range,
     };
 
     Some(SymbolInformation {
         name: name.to_string(),
-        kind: SymbolKind::CLASS,
+        kind,
         tags: None,
         deprecated: None,
         location,
@@ -628,19 +564,21 @@ fn create_contract_symbol_info(node: &Value, file_path: &str) -> Option<SymbolIn
     })
 }
 
-fn create_function_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
+fn create_function_symbol_info(node: &Value, lines: &LineIndex, uri: &Url) -> Option<SymbolInformation> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-    let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
-        range,
-    };
 
-    // Skip constructors (they have empty name in some AST versions)
+    // Skip constructors (they have empty name in some AST versions), before any
+    // work goes into locating them
     if name.is_empty() {
         return None;
     }
 
+    let range = get_node_range(node, lines)?;
+    let location = Location {
+        uri: uri.clone(),
+        range,
+    };
+
     let kind = if node.get("kind").and_then(|v| v.as_str()) == Some("constructor") {
         SymbolKind::CONSTRUCTOR
     } else {
@@ -657,11 +595,11 @@ fn create_function_symbol_info(node: &Value, file_path: &str) -> Option<SymbolIn
     })
 }
 
-fn create_variable_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
+fn create_variable_symbol_info(node: &Value, lines: &LineIndex, uri: &Url) -> Option<SymbolInformation> {
     let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
+    let range = get_node_range(node, lines)?;
     let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
+        uri: uri.clone(),
         range,
     };
 
@@ -682,92 +620,11 @@ fn create_variable_symbol_info(node: &Value, file_path: &str) -> Option<SymbolIn
     })
 }
 
-fn create_event_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-    let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
-        range,
-    };
-
-    Some(SymbolInformation {
-        name: name.to_string(),
-        kind: SymbolKind::EVENT,
-        tags: None,
-        deprecated: None,
-        location,
-        container_name: None,
-    })
-}
-
-fn create_modifier_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-    let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
-        range,
-    };
-
-    Some(SymbolInformation {
-        name: name.to_string(),
-        kind: SymbolKind::METHOD, // Modifiers are represented as methods
-        tags: None,
-        deprecated: None,
-        location,
-        container_name: None,
-    })
-}
-
-fn create_struct_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-    let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
-        range,
-    };
-
-    Some(SymbolInformation {
-        name: name.to_string(),
-        kind: SymbolKind::STRUCT,
-        tags: None,
-        deprecated: None,
-        location,
-        container_name: None,
-    })
-}
-
-fn create_enum_symbol_info(node: &Value, file_path: &str) -> Option<SymbolInformation> {
-    let name = node.get("name").and_then(|v| v.as_str())?;
-    let range = get_node_range(node, file_path)?;
-    let location = Location {
-        uri: Url::from_file_path(file_path).ok()?,
-        range,
-    };
-
-    Some(SymbolInformation {
-        name: name.to_string(),
-        kind: SymbolKind::STRUCT,
-        tags: None,
-        deprecated: None,
-        location,
-        container_name: None,
-    })
-}
-
-fn get_node_range(node: &Value, file_path: &str) -> Option<Range> {
+fn get_node_range(node: &Value, lines: &LineIndex) -> Option<Range> {
     let src = node.get("src").and_then(|v| v.as_str())?;
-    let parts: Vec<&str> = src.split(':').collect();
-    if parts.len() < 3 {
-        return None;
-    }
-
-    let start_offset: usize = parts[0].parse().ok()?;
-    let length: usize = parts[1].parse().ok()?;
-
-    // Read the file content to convert byte offsets to positions
-    let content = std::fs::read_to_string(file_path).ok()?;
-    let (start_line, start_col) = byte_offset_to_position(&content, start_offset);
-    let (end_line, end_col) = byte_offset_to_position(&content, start_offset + length);
+    let (start_offset, length, _) = parse_src(src)?;
+    let ((start_line, start_col), (end_line, end_col)) =
+        lines.range(start_offset, start_offset + length);
 
     Some(Range {
         start: Position { line: start_line, character: start_col },
@@ -779,10 +636,10 @@ fn push_child_nodes<'a>(node: &'a Value, stack: &mut Vec<&'a Value>) {
     if let Some(children) = node.as_object() {
         for value in children.values() {
             match value {
+                // Arrays also hold plain values (pragma literals, name locations),
+                // which have nothing to visit, so only objects are pushed
                 Value::Array(arr) => {
-                    for item in arr {
-                        stack.push(item);
-                    }
+                    stack.extend(arr.iter().filter(|item| item.is_object()));
                 }
                 Value::Object(_) => {
                     stack.push(value);
@@ -794,17 +651,12 @@ fn push_child_nodes<'a>(node: &'a Value, stack: &mut Vec<&'a Value>) {
 }
 
 fn is_state_variable(node: &Value) -> bool {
-    // A variable is a state variable if it's not inside a function body
-    // We can check this by walking up the AST to see if we're inside a function
-    let mut current = node;
-    while let Some(parent) = current.get("parent") {
-        if let Some(node_type) = parent.get("nodeType").and_then(|v| v.as_str())
-            && (node_type == "FunctionDefinition" || node_type == "ModifierDefinition") {
-                return false; // Inside a function or modifier, so it's local
-            }
-        current = parent;
-    }
-    true // Not inside a function, so it's a state variable
+    // solc marks every VariableDeclaration with whether it is declared at contract
+    // scope, so no walk up the tree is needed (the AST has no parent links to walk).
+    // Nodes without the flag keep being treated as state variables
+    node.get("stateVariable")
+        .and_then(|v| v.as_bool())
+        .unwrap_or(true)
 }
 
 #[cfg(test)]
@@ -812,6 +664,32 @@ mod tests {
     use super::*;
     use std::process::Command;
 
+    #[test]
+    fn test_symbol_index_search() {
+        let symbol = |name: &str| SymbolInformation {
+            name: name.to_string(),
+            kind: SymbolKind::FUNCTION,
+            tags: None,
+            deprecated: None,
+            location: Location {
+                uri: Url::parse("file:///A.sol").unwrap(),
+                range: Range::default(),
+            },
+            container_name: None,
+        };
+        let index = SymbolIndex::new(vec![symbol("transfer"), symbol("TransferEvent"), symbol("mint")]);
+
+        let names = |query: &str| -> Vec<String> {
+            index.search(query).into_iter().map(|s| s.name).collect()
+        };
+        assert_eq!(names("TRANSFER"), vec!["transfer", "TransferEvent"]);
+        assert_eq!(names("int"), vec!["mint"]);
+        assert_eq!(names("n"), vec!["transfer", "TransferEvent", "mint"]);
+        assert_eq!(names("r\nt"), Vec::<String>::new());
+        assert_eq!(names("").len(), 3);
+        assert!(names("burn").is_empty());
+    }
+
     fn get_test_ast_data() -> Option<serde_json::Value> {
         let output = Command::new("forge")
             .args(["build", "--ast", "--silent", "--build-info"])
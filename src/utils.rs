@@ -1,3 +1,5 @@
+use std::hash::{DefaultHasher, Hash, Hasher};
+
 pub fn byte_offset_to_position(source: &str, byte_offset: usize) -> (u32, u32) {
     let mut line = 0;
     let mut col = 0;
@@ -52,22 +54,197 @@ pub fn position_to_byte_offset(source: &str, line: u32, character: u32) -> usize
     source.len()
 }
 
-/// Check if a string is a valid Solidity identifier
-pub fn is_valid_solidity_identifier(name: &str) -> bool {
-    if name.is_empty() {
-        return false;
+/// Byte offsets at which each line of a source text starts, built once so that
+/// offset/position conversions don't rescan the text
+#[derive(Debug, Clone)]
+pub struct LineIndex {
+    line_starts: Vec<usize>,
+    len: usize,
+}
+
+impl LineIndex {
+    pub fn new(source: &str) -> Self {
+        let line_starts = std::iter::once(0)
+            .chain(source.match_indices('\n').map(|(i, _)| i + 1))
+            .collect();
+        Self {
+            line_starts,
+            len: source.len(),
+        }
     }
-    let chars: Vec<char> = name.chars().collect();
-    let first = chars[0];
-    if !first.is_ascii_alphabetic() && first != '_' {
-        return false;
+
+    /// Length in bytes of the indexed source
+    pub fn len(&self) -> usize {
+        self.len
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.len == 0
     }
-    for &c in &chars {
-        if !c.is_ascii_alphanumeric() && c != '_' {
-            return false;
+
+    /// Byte offset at which `line` starts, or `None` past the last line
+    pub fn line_start(&self, line: u32) -> Option<usize> {
+        self.line_starts.get(line as usize).copied()
+    }
+
+    /// Text of `line` without its line terminator
+    pub fn line<'a>(&self, source: &'a str, line: u32) -> Option<&'a str> {
+        let start = self.line_start(line)?;
+        let end = self
+            .line_start(line + 1)
+            .map_or(source.len(), |next| next - 1);
+        let text = &source[start..end];
+        Some(text.strip_suffix('\r').unwrap_or(text))
+    }
+
+    /// Same as [`byte_offset_to_position`], in `O(log lines)`
+    pub fn position(&self, byte_offset: usize) -> (u32, u32) {
+        let byte_offset = byte_offset.min(self.len);
+        let line = self
+            .line_starts
+            .partition_point(|&start| start <= byte_offset)
+            - 1;
+        (line as u32, (byte_offset - self.line_starts[line]) as u32)
+    }
+
+    /// Positions of `start` and `end`. Most ranges are a single identifier, so the
+    /// line of `start` is tried for `end` before searching again
+    pub fn range(&self, start: usize, end: usize) -> ((u32, u32), (u32, u32)) {
+        let start_position = self.position(start);
+        let (line, _) = start_position;
+        let line_start = self.line_starts[line as usize];
+        let end = end.min(self.len);
+        let next_line_start = self.line_starts.get(line as usize + 1);
+        if line_start <= end && next_line_start.is_none_or(|&next| end < next) {
+            return (start_position, (line, (end - line_start) as u32));
         }
+        (start_position, self.position(end))
     }
-    true
+}
+
+/// Split a solc source location `start:length:file_id` into its parts without
+/// collecting them
+pub fn parse_src(src: &str) -> Option<(usize, usize, &str)> {
+    let mut parts = src.split(':');
+    let start = parts.next()?.parse().ok()?;
+    let length = parts.next()?.parse().ok()?;
+    let file_id = parts.next()?;
+    if parts.next().is_some() {
+        return None;
+    }
+    Some((start, length, file_id))
+}
+
+/// A solc source location parsed into integers, so it can be stored and compared
+/// without keeping the `start:length:file_id` string around
+#[derive(Debug, Clone, Copy, PartialEq, Eq, Hash)]
+pub struct SrcLocation {
+    start: u32,
+    length: u32,
+    file_id: i32,
+}
+
+impl SrcLocation {
+    /// Parse `start:length:file_id`. solc uses a file id of -1 for locations outside
+    /// any source
+    pub fn parse(src: &str) -> Option<Self> {
+        let (start, length, file_id) = parse_src(src)?;
+        Some(Self {
+            start: start.try_into().ok()?,
+            length: length.try_into().ok()?,
+            file_id: file_id.parse().ok()?,
+        })
+    }
+
+    /// Byte offset the location starts at
+    pub fn start(&self) -> usize {
+        self.start as usize
+    }
+
+    /// Length of the location in bytes
+    pub fn length(&self) -> usize {
+        self.length as usize
+    }
+
+    /// Byte offset just past the end of the location
+    pub fn end(&self) -> usize {
+        self.start() + self.length()
+    }
+
+    /// Id of the source file, as keyed in a build's `source_id_to_path`
+    pub fn file_id(&self) -> i32 {
+        self.file_id
+    }
+}
+
+/// Whether `byte` can be part of a Solidity identifier
+pub fn is_identifier_byte(byte: u8) -> bool {
+    byte.is_ascii_alphanumeric() || byte == b'_'
+}
+
+/// Whether `byte_offset` lies inside a comment or a string literal of `source`
+pub fn is_in_comment_or_string(source: &[u8], byte_offset: usize) -> bool {
+    let mut i = 0;
+    while i < byte_offset && i < source.len() {
+        let end = match (source[i], source.get(i + 1)) {
+            (b'/', Some(b'/')) => source[i..]
+                .iter()
+                .position(|&b| b == b'\n')
+                .map_or(source.len(), |len| i + len),
+            (b'/', Some(b'*')) => source[i + 2..]
+                .windows(2)
+                .position(|pair| pair == b"*/")
+                .map_or(source.len(), |len| i + 2 + len + 2),
+            (quote @ (b'"' | b'\''), _) => {
+                let mut j = i + 1;
+                while j < source.len() && source[j] != quote && source[j] != b'\n' {
+                    j += if source[j] == b'\\' { 2 } else { 1 };
+                }
+                (j + 1).min(source.len())
+            }
+            _ => {
+                i += 1;
+                continue;
+            }
+        };
+        if byte_offset < end {
+            return true;
+        }
+        i = end;
+    }
+    false
+}
+
+/// Whether a cursor at `byte_offset` can be on a symbol: next to an identifier
+/// character and outside comments and string literals
+pub fn may_reference_symbol(source: &[u8], byte_offset: usize) -> bool {
+    let touches_identifier = source
+        .get(byte_offset)
+        .is_some_and(|&b| is_identifier_byte(b))
+        || byte_offset
+            .checked_sub(1)
+            .and_then(|before| source.get(before))
+            .is_some_and(|&b| is_identifier_byte(b));
+    touches_identifier && !is_in_comment_or_string(source, byte_offset)
+}
+
+/// Check if a string is a valid Solidity identifier
+pub fn is_valid_solidity_identifier(name: &str) -> bool {
+    // Identifiers are ASCII, so checking bytes is enough and avoids collecting chars
+    let mut bytes = name.bytes();
+    let Some(first) = bytes.next() else {
+        return false;
+    };
+    (first.is_ascii_alphabetic() || first == b'_')
+        && bytes.all(|b| b.is_ascii_alphanumeric() || b == b'_')
+}
+
+/// Hash document content into a stable identifier, used as the `resultId` of
+/// pull diagnostics reports
+pub fn content_hash(content: &str) -> String {
+    let mut hasher = DefaultHasher::new();
+    content.hash(&mut hasher);
+    format!("{:016x}", hasher.finish())
 }
 
 #[cfg(test)]
@@ -138,6 +315,117 @@ mod tests {
         assert_eq!(position_to_byte_offset(source, 0, 0), 0);
     }
 
+    #[test]
+    fn test_line_index_position() {
+        for source in [
+            "line1\nline2\nline3\n",
+            "line1\r\nline2\r\nline3\r\n",
+            "justoneline",
+            "short\nfile",
+            "",
+        ] {
+            let index = LineIndex::new(source);
+            for offset in 0..source.len() + 10 {
+                if source.as_bytes().get(offset) == Some(&b'\n')
+                    && offset > 0
+                    && source.as_bytes()[offset - 1] == b'\r'
+                {
+                    continue;
+                }
+                assert_eq!(
+                    index.position(offset),
+                    byte_offset_to_position(source, offset),
+                    "offset {offset} in {source:?}"
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn test_line_index_range() {
+        let source = "contract A {\n    uint value;\n}\n";
+        let index = LineIndex::new(source);
+        for start in 0..source.len() + 2 {
+            for end in 0..source.len() + 2 {
+                assert_eq!(
+                    index.range(start, end),
+                    (index.position(start), index.position(end)),
+                    "range {start}..{end}"
+                );
+            }
+        }
+    }
+
+    #[test]
+    fn test_line_index_lines() {
+        let source = "line1\r\nline2\n\nline4";
+        let index = LineIndex::new(source);
+        assert_eq!(index.len(), source.len());
+        assert_eq!(index.line_start(0), Some(0));
+        assert_eq!(index.line_start(1), Some(7));
+        assert_eq!(index.line_start(3), Some(14));
+        assert_eq!(index.line_start(4), None);
+        assert_eq!(index.line(source, 0), Some("line1"));
+        assert_eq!(index.line(source, 1), Some("line2"));
+        assert_eq!(index.line(source, 2), Some(""));
+        assert_eq!(index.line(source, 3), Some("line4"));
+        assert_eq!(index.line(source, 4), None);
+    }
+
+    #[test]
+    fn test_parse_src() {
+        assert_eq!(parse_src("81:5:0"), Some((81, 5, "0")));
+        assert_eq!(parse_src("0:0:12"), Some((0, 0, "12")));
+        assert_eq!(parse_src("81:5"), None);
+        assert_eq!(parse_src("81:5:0:1"), None);
+        assert_eq!(parse_src("a:5:0"), None);
+        assert_eq!(parse_src(""), None);
+    }
+
+    #[test]
+    fn test_src_location_parse() {
+        let location = SrcLocation::parse("81:5:2").unwrap();
+        assert_eq!(location.start(), 81);
+        assert_eq!(location.length(), 5);
+        assert_eq!(location.end(), 86);
+        assert_eq!(location.file_id(), 2);
+
+        assert_eq!(SrcLocation::parse("0:0:-1").unwrap().file_id(), -1);
+        assert_eq!(SrcLocation::parse("81:5"), None);
+        assert_eq!(SrcLocation::parse("81:5:a"), None);
+        assert_eq!(SrcLocation::parse("-1:5:0"), None);
+        assert_eq!(SrcLocation::parse("4294967296:0:0"), None);
+    }
+
+    #[test]
+    fn test_is_in_comment_or_string() {
+        let source = b"uint a; // note b\n/* c */ string s = \"d\\\"e\"; f";
+        let offset = |needle: &str| {
+            source
+                .windows(needle.len())
+                .position(|w| w == needle.as_bytes())
+                .unwrap()
+        };
+        assert!(!is_in_comment_or_string(source, offset("a;")));
+        assert!(is_in_comment_or_string(source, offset("note")));
+        assert!(is_in_comment_or_string(source, offset(" c ")));
+        assert!(!is_in_comment_or_string(source, offset("string")));
+        assert!(is_in_comment_or_string(source, offset("d")));
+        assert!(is_in_comment_or_string(source, offset("e\"")));
+        assert!(!is_in_comment_or_string(source, offset("f")));
+        assert!(is_in_comment_or_string(b"/* open", 4));
+    }
+
+    #[test]
+    fn test_may_reference_symbol() {
+        let source = b"uint value = 1; // value";
+        assert!(may_reference_symbol(source, 5));
+        assert!(may_reference_symbol(source, 10)); // end of `value`
+        assert!(!may_reference_symbol(source, 11)); // between spaces
+        assert!(!may_reference_symbol(source, 20)); // inside the comment
+        assert!(!may_reference_symbol(b"", 0));
+    }
+
     #[test]
     fn test_is_valid_solidity_identifier() {
         assert!(is_valid_solidity_identifier("validName"));
@@ -152,5 +440,14 @@ mod tests {
         assert!(!is_valid_solidity_identifier("invalid-name"));
         assert!(!is_valid_solidity_identifier("invalid name"));
         assert!(!is_valid_solidity_identifier("invalid.name"));
+        assert!(!is_valid_solidity_identifier("naïve"));
+    }
+
+    #[test]
+    fn test_content_hash() {
+        let source = "contract A {}";
+        assert_eq!(content_hash(source), content_hash("contract A {}"));
+        assert_ne!(content_hash(source), content_hash("contract B {}"));
+        assert_eq!(content_hash(source).len(), 16);
     }
 }